@@ -0,0 +1,59 @@
+"""
+Regression gate of the benchmarks: store results as a baseline and compare
+later runs against it.
+
+Results map a benchmark name to a dict that contains at least a
+"throughput" (higher is better). A benchmark regresses when its
+throughput drops by more than the tolerance relative to the baseline.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+
+def add_arguments(parser):
+    parser.add_argument("--save", metavar="FILE", help="store the results as baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare to a baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative throughput loss (default: 0.2)",
+    )
+
+
+def save(results, file):
+    Path(file).write_text(json.dumps(results, indent=2, sort_keys=True))
+
+
+def compare(results, file, tolerance):
+    """Print the comparison to the baseline, returns the regressed names."""
+    baseline = json.loads(Path(file).read_text())
+    regressions = []
+    print(f"\n{'benchmark':>32} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["throughput"]
+        after = result["throughput"]
+        change = after / before - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:>32} {before:>12.4g} {after:>12.4g} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def finish(results, args):
+    # Store and/or check the results, returns the exit code of the benchmark.
+    if args.save:
+        save(results, args.save)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks regressed beyond the tolerance.")
+            return 1
+    return 0
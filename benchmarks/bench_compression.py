@@ -0,0 +1,100 @@
+"""
+Write and read-back throughput and compression ratio of the HDF5 storage
+options (io.storage) on representative pipeline outputs.
+
+The outputs of the synthetic pipeline (synthetic.make_instructions) are
+written in batches of --step-size events with h5_writer and read back
+completely with h5_reader. Throughput is measured in MB/s of uncompressed
+buffer data, the ratio is uncompressed data over file size.
+
+Usage: python benchmarks/bench_compression.py [--events N] [--multiplicity N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import awkward as ak
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "postproc"))
+
+from h5_reader import h5_reader
+from h5_writer import h5_writer
+from module_manager import module_manager
+from synthetic import make_events, make_geometry, make_instructions
+
+OPTIONS = {
+    "none": {},
+    "lzf": {"compression": "lzf"},
+    "lzf+shuffle": {"compression": "lzf", "shuffle": True},
+    "gzip1": {"compression": "gzip", "compression_opts": 1},
+    "gzip4": {"compression": "gzip", "compression_opts": 4},
+    "gzip4+shuffle": {"compression": "gzip", "compression_opts": 4, "shuffle": True},
+    "gzip9+shuffle": {"compression": "gzip", "compression_opts": 9, "shuffle": True},
+}
+
+
+def make_outputs(n_events, multiplicity, step_size, tmp):
+    geometry_file = Path(tmp) / "geometry.json"
+    geometry_file.write_text(json.dumps(make_geometry()))
+    inst = make_instructions(tmp, tmp, geometry_file)
+    mm = module_manager(inst)
+    batches = []
+    for seed, start in enumerate(range(0, n_events, step_size)):
+        pv = dict(
+            make_events(
+                min(step_size, n_events - start), multiplicity=multiplicity, seed=seed
+            )
+        )
+        for proc in mm.order:
+            proc.run(pv)
+        batches.append(ak.Array({key: pv[key] for key in inst["output"]}))
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--multiplicity", type=float, default=20)
+    parser.add_argument("--step-size", type=int, default=5000)
+    parser.add_argument("--chunk-events", type=int, nargs="+", default=[None, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        batches = make_outputs(args.events, args.multiplicity, args.step_size, tmp)
+        nbytes = sum(ak.to_packed(batch).nbytes for batch in batches) / 1e6
+        print(f"{nbytes:.1f} MB of output buffers for {args.events} events\n")
+        print(
+            f"{'storage':>14} {'chunk':>6} {'write MB/s':>11} {'read MB/s':>10} "
+            f"{'size [MB]':>10} {'ratio':>6}"
+        )
+        outfile = Path(tmp) / "output.hdf5"
+        for name, options in OPTIONS.items():
+            for chunk_events in args.chunk_events:
+                write_time = read_time = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    with h5_writer(outfile, chunk_events=chunk_events, **options) as w:
+                        for batch in batches:
+                            w.write(batch)
+                    write_time = min(write_time, time.perf_counter() - start)
+                    start = time.perf_counter()
+                    with h5_reader(outfile) as reader:
+                        reader.read()
+                    read_time = min(read_time, time.perf_counter() - start)
+                size = outfile.stat().st_size / 1e6
+                print(
+                    f"{name:>14} {chunk_events or 'auto':>6} "
+                    f"{nbytes / write_time:>11.1f} {nbytes / read_time:>10.1f} "
+                    f"{size:>10.2f} {nbytes / size:>6.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
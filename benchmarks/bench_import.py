@@ -0,0 +1,79 @@
+"""
+Worker start-up cost: importing the worker entry point (process.run_post_proc)
+and building the module chain of a pipeline.
+
+Every measurement runs in a fresh interpreter, like a spawned pool worker.
+Only the modules named in the pipeline are imported, so a pipeline without
+compiled kernels does not load numba.
+
+Usage: python benchmarks/bench_import.py [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src" / "postproc"
+
+PIPELINES = {
+    "threshold": ["sum_energy", "threshold"],
+    "window": ["window", "sum_energy", "threshold"],
+    "all": [
+        "window",
+        "coincidence_window",
+        "group_sensitive_volume",
+        "active_volume",
+        "r90_estimator",
+        "sum_energy",
+        "threshold",
+    ],
+}
+
+MEASURE = f"""
+import json, sys, time
+sys.path.insert(0, {str(SRC)!r})
+start = time.perf_counter()
+from process import run_post_proc
+from module import load_module
+times = {{"import": time.perf_counter() - start}}
+start = time.perf_counter()
+for name in json.loads(sys.argv[1]):
+    load_module(name)
+times["modules"] = time.perf_counter() - start
+times["numba"] = "numba" in sys.modules
+print(json.dumps(times))
+"""
+
+
+def measure(modules):
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE, json.dumps(modules)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'pipeline':>10} {'import [s]':>11} {'modules [s]':>12} {'numba':>6}")
+    for name, modules in PIPELINES.items():
+        times = [measure(modules) for _ in range(args.repeat)]
+        import_time = min(t["import"] for t in times)
+        modules_time = min(t["modules"] for t in times)
+        print(
+            f"{name:>10} {import_time:>11.3f} {modules_time:>12.3f} "
+            f"{'yes' if times[0]['numba'] else 'no':>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Cold- and warm-start cost of the compiled kernels (modules.kernels.warmup).
+
+Every measurement runs in a fresh interpreter. The cold start compiles all
+kernels into an empty numba cache directory, the warm start loads them from
+that cache again.
+
+Usage: python benchmarks/bench_jit.py [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src" / "postproc"
+
+MEASURE = f"""
+import json, sys, time
+sys.path.insert(0, {str(SRC)!r})
+start = time.perf_counter()
+from modules.kernels import MODULE_KERNELS, warmup
+times = {{"import": time.perf_counter() - start}}
+for name in MODULE_KERNELS:
+    times[name] = warmup([name])
+print(json.dumps(times))
+"""
+
+
+def measure(cache_dir):
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cold, warm = [], []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold.append(measure(cache_dir))
+            warm.append(measure(cache_dir))
+
+    print(f"{'stage':>20} {'cold [s]':>10} {'warm [s]':>10}")
+    for stage in cold[0]:
+        cold_time = min(c[stage] for c in cold)
+        warm_time = min(w[stage] for w in warm)
+        print(f"{stage:>20} {cold_time:>10.3f} {warm_time:>10.3f}")
+    cold_total = min(sum(c.values()) for c in cold)
+    warm_total = min(sum(w.values()) for w in warm)
+    print(f"{'total':>20} {cold_total:>10.3f} {warm_total:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
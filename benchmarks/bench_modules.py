@@ -0,0 +1,86 @@
+"""
+Throughput and peak memory of every module of the synthetic pipeline, for
+a range of event counts and hit multiplicities.
+
+Modules run in pipeline order on in-memory batches, so every module sees
+the outputs of its predecessors. Throughput is the best of --repeat runs,
+peak memory is the largest allocation traced (tracemalloc) during a
+separate run.
+
+Usage: python benchmarks/bench_modules.py [--events N ...]
+       [--multiplicity N ...] [--save FILE] [--baseline FILE]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "postproc"))
+
+import baseline
+from module_manager import module_manager
+from synthetic import make_events, make_geometry, make_instructions
+
+
+def measure(proc, pv, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc.run(pv)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    proc.run(pv)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--multiplicity", type=float, nargs="+", default=[5, 20, 80])
+    parser.add_argument("--repeat", type=int, default=3)
+    baseline.add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        geometry_file = Path(tmp) / "geometry.json"
+        geometry_file.write_text(json.dumps(make_geometry()))
+        inst = make_instructions(tmp, tmp, geometry_file)
+        mm = module_manager(inst)
+
+        # Compile the kernels outside of the timed region.
+        pv = dict(make_events(10, seed=1))
+        for proc in mm.order:
+            proc.run(pv)
+
+        results = {}
+        print(
+            f"{'module':>12} {'events':>8} {'mult':>5} {'time [s]':>9} "
+            f"{'events/s':>10} {'peak [MB]':>10}"
+        )
+        for n_events in args.events:
+            for multiplicity in args.multiplicity:
+                pv = dict(make_events(n_events, multiplicity=multiplicity))
+                for proc in mm.order:
+                    best, peak = measure(proc, pv, args.repeat)
+                    results[f"{proc.name}/{n_events}x{multiplicity:g}"] = {
+                        "time": best,
+                        "throughput": n_events / best,
+                        "peak_memory_mb": peak / 1e6,
+                    }
+                    print(
+                        f"{proc.name:>12} {n_events:>8} {multiplicity:>5g} "
+                        f"{best:>9.4f} {n_events / best:>10.4g} {peak / 1e6:>10.1f}"
+                    )
+    return baseline.finish(results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Throughput and peak memory of the full pipeline (process_manager) on
+synthetic ROOT files, for a range of event counts and hit multiplicities.
+
+Every run starts a fresh interpreter that processes all files with the
+pipeline of synthetic.make_instructions(). Throughput is the number of
+events per second of wall clock (best of --repeat runs, including
+start-up), peak memory the largest resident set size of that interpreter
+and its workers.
+
+Usage: python benchmarks/bench_pipeline.py [--events N ...]
+       [--multiplicity N ...] [--threads N] [--save FILE] [--baseline FILE]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import baseline
+from synthetic import make_instructions, write_inputs
+
+SRC = Path(__file__).resolve().parents[1] / "src" / "postproc"
+
+RUN = f"""
+import json, resource, sys, time, warnings
+warnings.filterwarnings("ignore")
+sys.path.insert(0, {str(SRC)!r})
+start = time.perf_counter()
+import process_manager
+pm = process_manager.process_manager(json.loads(sys.argv[1]), overwrite=True)
+pm.run_processes()
+wall = time.perf_counter() - start
+peak = max(
+    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+)
+print(json.dumps({{"wall": wall, "peak_rss_mb": peak / 1e3}}))
+"""
+
+
+def run(inst):
+    result = subprocess.run(
+        [sys.executable, "-c", RUN, json.dumps(inst)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--multiplicity", type=float, nargs="+", default=[5, 20])
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--step-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=2)
+    baseline.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    print(
+        f"{'events':>8} {'mult':>5} {'time [s]':>9} {'events/s':>10} {'peak [MB]':>10}"
+    )
+    for n_events in args.events:
+        for multiplicity in args.multiplicity:
+            with tempfile.TemporaryDirectory() as tmp:
+                input_folder = Path(tmp) / "input"
+                output = Path(tmp) / "output"
+                output.mkdir()
+                geometry_file = write_inputs(
+                    input_folder,
+                    n_files=args.files,
+                    n_events=n_events // args.files,
+                    multiplicity=multiplicity,
+                )
+                inst = make_instructions(
+                    input_folder, output, geometry_file, args.threads, args.step_size
+                )
+                # The first run fills the kernel cache.
+                run(inst)
+                runs = [run(inst) for _ in range(args.repeat)]
+            wall = min(r["wall"] for r in runs)
+            peak = max(r["peak_rss_mb"] for r in runs)
+            results[f"pipeline/{n_events}x{multiplicity:g}/t{args.threads}"] = {
+                "time": wall,
+                "throughput": n_events / wall,
+                "peak_memory_mb": peak,
+            }
+            print(
+                f"{n_events:>8} {multiplicity:>5g} {wall:>9.3f} "
+                f"{n_events / wall:>10.4g} {peak:>10.1f}"
+            )
+    return baseline.finish(results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
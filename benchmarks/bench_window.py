@@ -0,0 +1,61 @@
+"""
+Scaling of the window assignment (modules.window.generate_map) with the
+number of windows per event.
+
+Usage: python benchmarks/bench_window.py [--events N] [--hits-per-window N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "postproc"))
+
+from modules.window import define_windows, generate_map
+
+
+def make_times(n_events, n_windows, hits_per_window, dT, rng):
+    # Clusters of hits separated by more than dT, so that every cluster
+    # opens a new window.
+    n_hits = n_windows * hits_per_window
+    cluster = np.repeat(np.arange(n_windows), hits_per_window)
+    t = cluster * 10 * dT + rng.uniform(0, dT / 2, (n_events, n_hits))
+    t = rng.permuted(t, axis=1)
+    return ak.unflatten(t.ravel(), np.full(n_events, n_hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--hits-per-window", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    dT = 1e4
+
+    # Compile once outside of the timed region.
+    t_sub = make_times(2, 2, 2, dT, rng)
+    generate_map(t_sub, define_windows(t_sub, dT))
+
+    print(f"{'windows':>8} {'hits':>10} {'time [s]':>10} {'ns/hit':>8}")
+    for n_windows in (1, 4, 16, 64, 256):
+        t_sub = make_times(args.events, n_windows, args.hits_per_window, dT, rng)
+        w_t = define_windows(t_sub, dT)
+        best = np.inf
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            generate_map(t_sub, w_t)
+            best = min(best, time.perf_counter() - start)
+        n_hits = args.events * n_windows * args.hits_per_window
+        print(f"{n_windows:>8} {n_hits:>10} {best:>10.4f} {1e9 * best / n_hits:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Deterministic synthetic Geant4-like hit data for the benchmarks.
+
+Detectors are cylinders (r = 39, h = 80) on a grid in the xy plane with
+volume IDs 1010000, 1010001, ... Every event has a Poisson number of hits
+with exponential energies. Hits belong to one of a few steps of a decay
+chain, separated by exponential delays of chain_spread (ns), so events span
+several time windows. make_geometry() returns the matching dead-layer
+geometry for the active_volume module.
+
+Usage: python benchmarks/synthetic.py OUTDIR [--files N] [--events N]
+       [--multiplicity N] [--chain-spread T]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+import uproot
+
+FIRST_VOLUME = 1010000
+SPACING = 100.0
+MESH_Z = [0.0, 5.0, 20.0, 60.0, 80.0]
+MESH_R = [30.0, 38.0, 39.0, 39.0, 25.0]
+
+
+def detector_centers(n_detectors):
+    d = np.arange(n_detectors)
+    return np.stack([(d % 4) * SPACING, (d // 4) * SPACING], axis=1)
+
+
+def make_geometry(n_detectors=8):
+    geometry = {}
+    for d, (cx, cy) in enumerate(detector_centers(n_detectors)):
+        geometry[str(FIRST_VOLUME + d)] = {
+            "center": [float(cx), float(cy), 0.0],
+            "surface_mesh": {
+                "orig": {"r": [r + 1 for r in MESH_R], "z": MESH_Z},
+                "dl": {"r": MESH_R, "z": MESH_Z},
+            },
+        }
+    return geometry
+
+
+def make_events(
+    n_events,
+    multiplicity=20,
+    n_detectors=8,
+    chain_steps=4,
+    chain_spread=1e6,
+    seed=0,
+):
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(multiplicity, n_events)
+    n_hits = int(counts.sum())
+
+    step = rng.integers(0, chain_steps, n_hits)
+    t = step * rng.exponential(chain_spread, n_hits) + rng.exponential(50.0, n_hits)
+    detector = rng.integers(0, n_detectors, n_hits)
+    center = detector_centers(n_detectors)[detector]
+    r = rng.uniform(0, 42, n_hits)
+    phi = rng.uniform(0, 2 * np.pi, n_hits)
+    edep = rng.exponential(100.0, n_hits)
+    edep[rng.random(n_hits) < 0.02] = 0.0
+
+    hits = {
+        "t": t,
+        "edep": edep,
+        "vol": (FIRST_VOLUME + detector).astype(np.int32),
+        "x": center[:, 0] + r * np.cos(phi),
+        "y": center[:, 1] + r * np.sin(phi),
+        "z": rng.uniform(-2, 82, n_hits),
+    }
+    events = {key: ak.unflatten(value, counts) for key, value in hits.items()}
+    events["evtid"] = np.arange(n_events)
+    return events
+
+
+def write_inputs(folder, n_files=2, n_events=1000, seed=0, **kwargs):
+    """Write n_files ROOT files (tree "hit") and the geometry to folder."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    for i in range(n_files):
+        with uproot.recreate(folder / f"sim_{i}.root") as f:
+            f["hit"] = make_events(n_events, seed=seed + i, **kwargs)
+    geometry_file = folder / "geometry.json"
+    geometry_file.write_text(json.dumps(make_geometry(kwargs.get("n_detectors", 8))))
+    return geometry_file
+
+
+def make_instructions(input_folder, output, geometry_file, threads=1, step_size=1000):
+    """Instructions of a pipeline that uses every module."""
+    return {
+        "io": {
+            "input": {"folder": str(input_folder), "format": "root"},
+            "output": str(output),
+        },
+        "input": {
+            "tree": "hit",
+            "var": {key: f"hit/{key}" for key in ("t", "edep", "vol", "x", "y", "z")},
+        },
+        "para": {"threads": threads, "step_size": step_size},
+        "instr": [
+            {
+                "name": "window",
+                "module": "window",
+                "input": ["t", "t", "edep", "vol", "x", "y", "z"],
+                "output": ["w_t", "t_sub", "w_edep", "w_vol", "w_x", "w_y", "w_z"],
+                "para": {"dT": 1e4},
+            },
+            {
+                "name": "coincidence",
+                "module": "coincidence_window",
+                "input": ["w_t", "w_t", "w_edep"],
+                "output": ["coinc"],
+                "para": {"t_min": 0, "t_max": 3e6},
+            },
+            {
+                "name": "cylinder",
+                "module": "active_volume",
+                "input": ["w_t", "w_edep", "w_vol", "w_x", "w_y", "w_z"],
+                "output": ["c_t", "c_edep"],
+                "para": {
+                    "type": "cylinder",
+                    "conditions": {"r": 200, "h1": 60, "h2": 10},
+                },
+            },
+            {
+                "name": "group",
+                "module": "group_sensitive_volume",
+                "input": ["t_sub", "w_edep", "w_vol", "w_x", "w_y", "w_z"],
+                "output": ["g_t", "g_edep", "g_vol", "g_x", "g_y", "g_z"],
+            },
+            {
+                "name": "deadlayer",
+                "module": "active_volume",
+                "input": ["g_t", "g_edep", "g_vol", "g_x", "g_y", "g_z"],
+                "output": ["a_t", "a_edep", "a_vol", "a_x", "a_y", "a_z", "a_vol_red"],
+                "para": {"type": "deadlayer", "file": str(geometry_file)},
+            },
+            {
+                "name": "r90",
+                "module": "r90_estimator",
+                "input": ["a_edep", "a_x", "a_y", "a_z"],
+                "output": ["r90"],
+            },
+            {
+                "name": "energy",
+                "module": "sum_energy",
+                "input": ["a_edep"],
+                "output": ["E"],
+            },
+            {
+                "name": "threshold",
+                "module": "threshold",
+                "input": ["E"],
+                "output": ["E_thr"],
+                "para": {"thr": [10, 3000]},
+            },
+        ],
+        "output": [
+            "w_t",
+            "coinc",
+            "c_edep",
+            "a_edep",
+            "a_vol_red",
+            "r90",
+            "E",
+            "E_thr",
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("outdir")
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--multiplicity", type=float, default=20)
+    parser.add_argument("--chain-spread", type=float, default=1e6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_inputs(
+        args.outdir,
+        n_files=args.files,
+        n_events=args.events,
+        seed=args.seed,
+        multiplicity=args.multiplicity,
+        chain_spread=args.chain_spread,
+    )
+
+
+if __name__ == "__main__":
+    main()
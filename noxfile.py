@@ -44,6 +44,28 @@ def tests(session: nox.Session) -> None:
     session.run("pytest", *session.posargs)
 
 
+@nox.session
+def benchmarks(session: nox.Session) -> None:
+    """
+    Run the benchmarks and compare them to the baselines in benchmarks/baselines, failing if a baseline is missing. Pass --save to store the results as new baselines instead.
+    """
+    session.install("awkward", "h5py", "numba", "numpy", "tqdm", "uproot")
+    baselines = DIR.joinpath("benchmarks", "baselines")
+    save = "--save" in session.posargs
+    for name in ("modules", "pipeline"):
+        baseline = baselines.joinpath(f"{name}.json")
+        if save:
+            baselines.mkdir(exist_ok=True)
+            options = ["--save", str(baseline)]
+        elif baseline.exists():
+            options = ["--baseline", str(baseline)]
+        else:
+            session.error(
+                f"Missing baseline {baseline}, store one with 'nox -s benchmarks -- --save'."
+            )
+        session.run("python", f"benchmarks/bench_{name}.py", *options)
+
+
 @nox.session(reuse_venv=True)
 def docs(session: nox.Session) -> None:
     """
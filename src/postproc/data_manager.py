@@ -1,74 +1,123 @@
 from __future__ import annotations
 
+from pathlib import Path
+
 import awkward as ak
-import h5py
-import numpy as np
 import uproot
+from h5_reader import h5_reader
+from output import output_writer
 from tqdm import tqdm
 
 
 class data_manager:
-    def __init__(self, inst, infile, outfile, pm, task_id):
+    def __init__(
+        self, inst, infile, outfile, pm, task_id, entry_start=None, entry_stop=None
+    ):
         self.inst = inst
         self.infile = infile
         self.infile_format = inst["io"]["input"]["format"]
         self.outfile = outfile
         self.module_manager = pm
-        self.output_dict = {}
+        self.writer = None
+        self.new_writer = output_writer(inst)
         self.task_id = task_id
-        for key in self.inst["output"]:
-            self.output_dict[key] = []
+        self.entry_start = entry_start
+        self.entry_stop = entry_stop
+        self.io_report = None
         if self.infile_format == "root":
             self.ttree = uproot.open(self.infile)[self.inst["input"]["tree"]]
+            # Only the branches used by the pipeline are read and decompressed.
+            self.branches = sorted(
+                {value.rsplit("/")[-1] for value in self.inst["input"]["var"].values()}
+            )
         elif self.infile_format == "hdf5":
-            with h5py.File(self.infile, "r") as f:
-                group = f[self.inst["input"]["base_name"]]
-                reconstituted = ak.from_buffers(
-                    ak.forms.from_json(group.attrs["form"]),
-                    group.attrs["length"],
-                    {k: np.asarray(v) for k, v in group.items()},
-                )
-            self.ttree = ak.Array(reconstituted)
+            self.ttree = h5_reader(
+                self.infile,
+                self.inst["input"]["base_name"],
+                fields=self.inst["input"]["var"].values(),
+            )
 
     def process_data(self):
         if self.infile_format == "root":
-            n_entries = self.ttree.num_entries
-            pbar = tqdm(total=n_entries, position=self.task_id)
-            for batch, report in self.ttree.iterate(
-                step_size=self.inst["para"]["step_size"], report=True
-            ):
+            entry_start = 0 if self.entry_start is None else self.entry_start
+            entry_stop = (
+                self.ttree.num_entries if self.entry_stop is None else self.entry_stop
+            )
+            pbar = tqdm(total=entry_stop - entry_start, position=self.task_id)
+            batches = self.ttree.iterate(
+                step_size=self.inst["para"]["step_size"],
+                entry_start=entry_start,
+                entry_stop=entry_stop,
+                filter_name=self.branches,
+                report=True,
+            )
+            for batch, report in self.module_manager.telemetry.iterate(batches, "read"):
                 processing_variables = {
                     key: batch[value.rsplit("/")[-1]]
                     for key, value in self.inst["input"]["var"].items()
                 }
-                self.module_manager.run(processing_variables, pbar, self.task_id)
-                for key in self.output_dict:
-                    self.output_dict[key].extend(processing_variables[key])
+                self.module_manager.run(
+                    processing_variables,
+                    pbar,
+                    self.task_id,
+                    (self.infile, report.start, report.stop),
+                )
+                self.write_batch(processing_variables)
                 pbar.update(report.stop - report.start)
-            self.output_dict = ak.Array(self.output_dict)
             pbar.close()
+            self.io_report = {
+                "infile": str(self.infile),
+                "bytes_read": self.ttree.file.source.num_requested_bytes,
+                "bytes_available": Path(self.infile).stat().st_size,
+            }
 
         elif self.infile_format == "hdf5":
-            n_entries = len(self.ttree)
-            pbar = tqdm(total=n_entries, position=self.task_id)
-            # for entry in self.ttree:
-            #    pbar.update(1)
-            processing_variables = {
-                key: self.ttree[value]
-                for key, value in self.inst["input"]["var"].items()
-            }
-            self.module_manager.run(processing_variables, pbar, self.task_id)
-            for key in self.output_dict:
-                self.output_dict[key].extend(processing_variables[key])
-            self.output_dict = ak.Array(self.output_dict)
+            entry_start, entry_stop, _ = slice(
+                self.entry_start, self.entry_stop
+            ).indices(len(self.ttree))
+            pbar = tqdm(total=max(entry_stop - entry_start, 0), position=self.task_id)
+            batches = self.ttree.iterate(
+                self.inst["para"]["step_size"], entry_start, entry_stop
+            )
+            batch_start = entry_start
+            for batch in self.module_manager.telemetry.iterate(batches, "read"):
+                processing_variables = {
+                    key: batch[value]
+                    for key, value in self.inst["input"]["var"].items()
+                }
+                batch_stop = batch_start + len(batch)
+                self.module_manager.run(
+                    processing_variables,
+                    pbar,
+                    self.task_id,
+                    (self.infile, batch_start, batch_stop),
+                )
+                batch_start = batch_stop
+                self.write_batch(processing_variables)
+                pbar.update(len(batch))
             pbar.close()
+            self.ttree.close()
 
-    def write_output(self):
-        with h5py.File(self.outfile, "w") as f:
-            group = f.create_group("awkward")
-            # print(ak.to_packed(self.output_dict))
-            form, length, container = ak.to_buffers(
-                ak.to_packed(self.output_dict), container=group
+    def write_batch(self, processing_variables):
+        if self.writer is None:
+            self.writer = self.new_writer(self.outfile)
+        with self.module_manager.telemetry.span("write", "io"):
+            self.writer.write(
+                ak.Array(
+                    {key: processing_variables[key] for key in self.inst["output"]}
+                )
             )
-            group.attrs["form"] = form.to_json()
-            group.attrs["length"] = length
+
+    def write_output(self):
+        if self.writer is None:
+            self.writer = self.new_writer(self.outfile)
+        if self.writer.form is None:
+            self.writer.write(ak.Array({key: [] for key in self.inst["output"]}))
+        with self.module_manager.telemetry.span("close", "io"):
+            self.writer.close()
+
+    def discard_output(self):
+        # A partially written output would pass for a complete one later.
+        if self.writer is not None:
+            self.writer.close()
+        Path(self.outfile).unlink(missing_ok=True)
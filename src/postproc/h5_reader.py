@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import math
+from functools import partial
+from pathlib import Path
+
+import awkward as ak
+import h5py
+import numpy as np
+
+
+def node_length(form, buffers):
+    # Number of entries of the node described by form, derived from its buffers.
+    if isinstance(form, ak.forms.NumpyForm):
+        return len(buffers[f"{form.form_key}-data"]) // math.prod(form.inner_shape)
+    if isinstance(form, ak.forms.ListOffsetForm):
+        return len(buffers[f"{form.form_key}-offsets"]) - 1
+    if isinstance(form, ak.forms.IndexedOptionForm):
+        return len(buffers[f"{form.form_key}-index"])
+    if isinstance(form, ak.forms.ByteMaskedForm):
+        return len(buffers[f"{form.form_key}-mask"])
+    if isinstance(form, ak.forms.RegularForm):
+        if form.size == 0:
+            return 0
+        return node_length(form.content, buffers) // form.size
+    if isinstance(form, ak.forms.UnmaskedForm):
+        return node_length(form.content, buffers)
+    if isinstance(form, ak.forms.RecordForm) and len(form.contents):
+        return node_length(form.contents[0], buffers)
+    if isinstance(form, ak.forms.EmptyForm):
+        return 0
+    error_message = f"Cannot determine the length of {type(form).__name__}."
+    raise NotImplementedError(error_message)
+
+
+class h5_reader:
+    """
+    Chunked reader for awkward arrays in the postproc HDF5 layout.
+
+    Only the buffers of the selected record fields are read, and only the
+    part of them that belongs to the requested range of entries: offsets are
+    sliced first and determine the range of their content. Contiguous,
+    uncompressed datasets are memory-mapped instead of read through h5py.
+    """
+
+    def __init__(self, infile, group_name="awkward", fields=None):
+        self.file = h5py.File(infile, "r")
+        self.group = self.file[group_name]
+        self.form = ak.forms.from_json(self.group.attrs["form"])
+        self.length = int(self.group.attrs["length"])
+        if fields is not None and isinstance(self.form, ak.forms.RecordForm):
+            fields = list(dict.fromkeys(fields))
+            self.form = ak.forms.RecordForm(
+                [self.form.content(field) for field in fields],
+                fields,
+                parameters=self.form.parameters,
+            )
+        self._memmaps = {}
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, entry_start=None, entry_stop=None):
+        start, stop, _ = slice(entry_start, entry_stop).indices(self.length)
+        stop = max(start, stop)
+        buffers = {}
+        self._read_node(self.form, start, stop, buffers)
+        return ak.from_buffers(self.form, stop - start, buffers)
+
+    def iterate(self, step_size, entry_start=None, entry_stop=None):
+        start, stop, _ = slice(entry_start, entry_stop).indices(self.length)
+        for chunk_start in range(start, stop, step_size):
+            yield self.read(chunk_start, min(chunk_start + step_size, stop))
+
+    def _read_node(self, form, start, stop, buffers):
+        key = form.form_key
+        if isinstance(form, ak.forms.NumpyForm):
+            size = math.prod(form.inner_shape)
+            buffers[f"{key}-data"] = self.buffer(
+                f"{key}-data", start * size, stop * size
+            )
+        elif isinstance(form, ak.forms.ListOffsetForm):
+            offsets = np.asarray(self.buffer(f"{key}-offsets", start, stop + 1))
+            buffers[f"{key}-offsets"] = offsets - offsets[0]
+            self._read_node(form.content, int(offsets[0]), int(offsets[-1]), buffers)
+        elif isinstance(form, ak.forms.IndexedOptionForm):
+            index = np.asarray(self.buffer(f"{key}-index", start, stop))
+            valid = index[index >= 0]
+            first = int(valid.min()) if len(valid) else 0
+            last = int(valid.max()) + 1 if len(valid) else 0
+            buffers[f"{key}-index"] = np.where(index < 0, index, index - first)
+            self._read_node(form.content, first, last, buffers)
+        elif isinstance(form, ak.forms.ByteMaskedForm):
+            buffers[f"{key}-mask"] = self.buffer(f"{key}-mask", start, stop)
+            self._read_node(form.content, start, stop, buffers)
+        elif isinstance(form, ak.forms.RegularForm):
+            self._read_node(form.content, start * form.size, stop * form.size, buffers)
+        elif isinstance(form, ak.forms.UnmaskedForm):
+            self._read_node(form.content, start, stop, buffers)
+        elif isinstance(form, ak.forms.RecordForm):
+            for content in form.contents:
+                self._read_node(content, start, stop, buffers)
+        elif isinstance(form, ak.forms.EmptyForm):
+            pass
+        else:
+            error_message = f"Reading {type(form).__name__} is not supported."
+            raise NotImplementedError(error_message)
+
+    def buffer(self, name, start=0, stop=None):
+        """Entries start to stop of the raw buffer name, e.g. "node1-offsets"."""
+        if name not in self._memmaps:
+            self._memmaps[name] = self._memmap(self.group[name])
+        memmap = self._memmaps[name]
+        if memmap is not None:
+            return memmap[start:stop]
+        return self.group[name][start:stop]
+
+    def _memmap(self, dataset):
+        # Only datasets stored as one contiguous, unfiltered block in the file
+        # can be mapped directly.
+        if dataset.chunks is not None or dataset.is_virtual or not dataset.size:
+            return None
+        offset = dataset.id.get_offset()
+        if offset is None:
+            return None
+        return np.memmap(
+            self.file.filename,
+            dtype=dataset.dtype,
+            mode="r",
+            offset=offset,
+            shape=dataset.shape,
+        )
+
+    def close(self):
+        if self.file is None:
+            return
+        self._memmaps = {}
+        self.file.close()
+        self.file = None
+
+
+class output_reader:
+    """
+    Lazy reader for postproc HDF5 outputs: a single file, a list of files or a
+    directory of them.
+
+    array() returns the outputs of all files as one lazy awkward array. A
+    buffer is read when it is first needed, so e.g. ak.sum(array.E) only
+    reads the buffers of E; the reader must stay open until then. iterate()
+    reads the selected fields in chunks of at most step_size events; chunks
+    do not cross file boundaries.
+
+        with output_reader("out/", fields=["E", "a_edep"]) as reader:
+            for chunk in reader.iterate(10000):
+                ...
+    """
+
+    def __init__(self, path, fields=None, group_name="awkward"):
+        if isinstance(path, (list, tuple)):
+            self.files = [Path(file) for file in path]
+        elif Path(path).is_dir():
+            self.files = sorted(Path(path).glob("*.hdf5"))
+        else:
+            self.files = [Path(path)]
+        if not self.files:
+            error_message = f"No postproc outputs found in {path}."
+            raise FileNotFoundError(error_message)
+        self.readers = [h5_reader(file, group_name, fields) for file in self.files]
+        self.form = self.readers[0].form
+        self.length = sum(len(reader) for reader in self.readers)
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def array(self):
+        for file, reader in zip(self.files, self.readers):
+            if reader.form != self.form:
+                error_message = (
+                    f"{file} has a different form than {self.files[0]}, "
+                    "read the files separately or with iterate()."
+                )
+                raise ValueError(error_message)
+        return ak.from_buffers(
+            self.form, self.length, _lazy_buffers(self.form, self.readers)
+        )
+
+    def iterate(self, step_size, entry_start=None, entry_stop=None):
+        start, stop, _ = slice(entry_start, entry_stop).indices(self.length)
+        offset = 0
+        for reader in self.readers:
+            first, last = max(start - offset, 0), min(stop - offset, len(reader))
+            if first < last:
+                yield from reader.iterate(step_size, first, last)
+            offset += len(reader)
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+
+class _lazy_buffers:
+    # Buffers of ak.from_buffers, read and concatenated over the files on
+    # first access. Offsets and indices are shifted by the content lengths of
+    # the preceding files, as in h5_writer.
+
+    def __init__(self, form, readers):
+        self.readers = readers
+        self.forms = {}
+        self._collect(form)
+
+    def _collect(self, form):
+        if form.form_key is not None:
+            self.forms[form.form_key] = form
+        if isinstance(form, ak.forms.RecordForm):
+            for content in form.contents:
+                self._collect(content)
+        elif hasattr(form, "content"):
+            self._collect(form.content)
+
+    def __getitem__(self, name):
+        return partial(self.read, name)
+
+    def read(self, name):
+        parts = [np.asarray(reader.buffer(name)) for reader in self.readers]
+        if len(parts) == 1:
+            return parts[0]
+        key, kind = name.rsplit("-", 1)
+        if kind == "offsets":
+            base = 0
+            for i, part in enumerate(parts):
+                # Every file starts at 0, only the first keeps the leading 0.
+                parts[i] = (part if i == 0 else part[1:]) + base
+                base += int(part[-1])
+        elif kind == "index":
+            content = self.forms[key].content
+            base = 0
+            for i, (part, reader) in enumerate(zip(parts, self.readers)):
+                parts[i] = np.where(part < 0, part, part + base)
+                base += node_length(content, reader.group)
+        return np.concatenate(parts)
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import awkward as ak
+import h5py
+import numpy as np
+from h5_reader import h5_reader, node_length
+
+
+def merge_unknown(form, other):
+    """
+    form with its unknown (EmptyForm) nodes replaced by the corresponding
+    nodes of other, and the other way around. Form keys are not meaningful.
+    """
+    if isinstance(form, ak.forms.EmptyForm):
+        return other
+    if isinstance(other, ak.forms.EmptyForm) or type(form) is not type(other):
+        return form
+    if isinstance(form, ak.forms.RecordForm):
+        if form.fields != other.fields:
+            return form
+        return form.copy(
+            contents=[
+                merge_unknown(a, b) for a, b in zip(form.contents, other.contents)
+            ]
+        )
+    if hasattr(form, "content"):
+        return form.copy(content=merge_unknown(form.content, other.content))
+    return form
+
+
+def _match_keys(form, other, keys):
+    # Map the form keys of form onto those of other, which has the same
+    # structure except below the unknown nodes of form.
+    keys[form.form_key] = other.form_key
+    if isinstance(form, ak.forms.EmptyForm):
+        return
+    if isinstance(form, ak.forms.RecordForm):
+        for a, b in zip(form.contents, other.contents):
+            _match_keys(a, b, keys)
+    elif hasattr(form, "content"):
+        _match_keys(form.content, other.content, keys)
+
+
+INDEX_DTYPES = {
+    "i8": np.int8,
+    "u8": np.uint8,
+    "i32": np.int32,
+    "u32": np.uint32,
+    "i64": np.int64,
+}
+
+
+def _buffer_dtypes(form, dtypes):
+    # Names and dtypes of all buffers of form.
+    key = form.form_key
+    if isinstance(form, ak.forms.NumpyForm):
+        dtypes[f"{key}-data"] = ak.types.numpytype.primitive_to_dtype(form.primitive)
+    elif isinstance(form, ak.forms.ListOffsetForm):
+        dtypes[f"{key}-offsets"] = INDEX_DTYPES[form.offsets]
+    elif isinstance(form, ak.forms.IndexedOptionForm):
+        dtypes[f"{key}-index"] = INDEX_DTYPES[form.index]
+    elif isinstance(form, ak.forms.ByteMaskedForm):
+        dtypes[f"{key}-mask"] = INDEX_DTYPES[form.mask]
+    if isinstance(form, ak.forms.RecordForm):
+        for content in form.contents:
+            _buffer_dtypes(content, dtypes)
+    elif hasattr(form, "content"):
+        _buffer_dtypes(form.content, dtypes)
+    return dtypes
+
+
+def storage_options(inst):
+    """
+    Dataset options of the outputs from the "storage" entry of inst["io"].
+
+    Keys: "compression" ("gzip", "lzf" or null), "compression_opts" (gzip
+    level 0-9), "shuffle" (bool) and "chunk_events" (events per chunk).
+    """
+    storage = dict(inst["io"].get("storage", {}))
+    unknown = set(storage) - {
+        "compression",
+        "compression_opts",
+        "shuffle",
+        "chunk_events",
+    }
+    if unknown:
+        error_message = f"Unknown storage options {sorted(unknown)}."
+        raise ValueError(error_message)
+    compression = storage.get("compression")
+    if compression not in (None, "gzip", "lzf"):
+        error_message = f"Unsupported compression {compression!r}, use gzip or lzf."
+        raise ValueError(error_message)
+    level = storage.get("compression_opts")
+    if level is not None and (compression != "gzip" or level not in range(10)):
+        error_message = "compression_opts must be a gzip level between 0 and 9."
+        raise ValueError(error_message)
+    return storage
+
+
+class h5_writer:
+    """
+    Streaming writer for awkward arrays in the postproc HDF5 layout.
+
+    Every call to write() appends the buffers of one batch to resizable,
+    chunked datasets in the "awkward" group. Offsets and indices are shifted
+    by the number of entries already written, so the file always describes a
+    single array. The form and length attributes are written on close().
+
+    Datasets are compressed with compression ("gzip" or "lzf"), at the gzip
+    level compression_opts and optionally with the shuffle filter. Their
+    chunks hold about chunk_events events, converted to entries of every
+    buffer with the entries per event of the first batch that has data.
+
+    With virtual=True, data and mask buffers are not copied: they become
+    HDF5 virtual datasets that map onto the datasets of the appended groups
+    (see write_group), and only offsets and indices are stored in the file.
+    The source files must then be kept next to the output.
+    """
+
+    def __init__(
+        self,
+        outfile,
+        group_name="awkward",
+        virtual=False,
+        compression=None,
+        compression_opts=None,
+        shuffle=False,
+        chunk_events=None,
+    ):
+        self.file = h5py.File(outfile, "w")
+        self.group = self.file.create_group(group_name)
+        self.form = None
+        self.type = None
+        self.length = 0
+        self.virtual = virtual
+        self.dataset_options = {
+            "compression": compression,
+            "compression_opts": compression_opts,
+            "shuffle": shuffle or None,
+        }
+        self.chunk_events = chunk_events
+        self._batch_length = 0
+        self._node_lengths = {}
+        self._sources = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, array):
+        array = ak.to_packed(array)
+        form, length, buffers = ak.to_buffers(array)
+        if self.form is None:
+            self.form = form
+            self.type = form.type
+        elif form != self.form:
+            # Batches can differ in inferred types: unknown types (e.g. of
+            # all-empty lists) take the type of the other batches.
+            error_message = (
+                f"Batch form {form.to_json()} does not match the form "
+                f"{self.form.to_json()} of the previous batches."
+            )
+            merged = merge_unknown(self.form, form)
+            try:
+                array = ak.enforce_type(array, merged.type)
+            except (TypeError, ValueError) as e:
+                raise ValueError(error_message) from e
+            form, length, buffers = ak.to_buffers(ak.to_packed(array))
+            if merged.type != self.type:
+                self._replace_form(form)
+            if form != self.form:
+                raise ValueError(error_message)
+        self.write_buffers(length, buffers)
+
+    def _replace_form(self, form):
+        # The unknown nodes of the previous batches hold no data, so only the
+        # datasets of the other nodes are renamed to the keys of the new form.
+        # Datasets below the former unknown nodes are created on append.
+        keys = {}
+        _match_keys(self.form, form, keys)
+
+        def rename(name):
+            key, buffer = name.rsplit("-", 1)
+            return f"{keys[key]}-{buffer}"
+
+        renamed = {name: rename(name) for name in self.group}
+        for name in renamed:
+            self.group.move(name, f"{name}.tmp")
+        for name, new_name in renamed.items():
+            self.group.move(f"{name}.tmp", new_name)
+        self._node_lengths = {keys[k]: v for k, v in self._node_lengths.items()}
+        self._sources = {rename(k): v for k, v in self._sources.items()}
+        self.form = form
+        self.type = form.type
+
+    def write_group(self, group):
+        """Append the array stored in a group of another postproc output."""
+        form = ak.forms.from_json(group.attrs["form"])
+        length = int(group.attrs["length"])
+        if self.form is None:
+            self.form = form
+            self.type = form.type
+        elif form != self.form:
+            self.write(
+                ak.from_buffers(form, length, {k: v[()] for k, v in group.items()})
+            )
+            return
+        # Datasets are read one at a time while appending.
+        self.write_buffers(length, group)
+
+    def write_file(self, file, step_size=None):
+        """
+        Append the array stored in another postproc output file.
+
+        The file is read with h5_reader in chunks of step_size events (all at
+        once if None). With virtual=True, its datasets are mapped instead.
+        """
+        with h5_reader(file, self.group.name) as reader:
+            if self.virtual:
+                self.write_group(reader.group)
+            elif not step_size or len(reader) <= step_size:
+                self.write(reader.read())
+            else:
+                for chunk in reader.iterate(step_size):
+                    self.write(chunk)
+
+    def write_buffers(self, length, buffers):
+        """Append raw buffers that follow the form of the first batch."""
+        if self.form is None:
+            error_message = "write_buffers() requires a form, call write() first."
+            raise RuntimeError(error_message)
+        self._batch_length = int(length)
+        self._append_node(self.form, buffers)
+        self.length += int(length)
+
+    def _append_node(self, form, buffers):
+        key = form.form_key
+        if isinstance(form, ak.forms.NumpyForm):
+            self._append_data(f"{key}-data", buffers[f"{key}-data"])
+        elif isinstance(form, ak.forms.ListOffsetForm):
+            offsets = np.asarray(buffers[f"{key}-offsets"])
+            base = self._node_lengths.get(key, 0)
+            # The leading 0 is only written with the first batch.
+            first = 0 if f"{key}-offsets" not in self.group else 1
+            self._append(f"{key}-offsets", offsets[first:] - offsets[0] + base)
+            self._node_lengths[key] = base + int(offsets[-1] - offsets[0])
+            self._append_node(form.content, buffers)
+        elif isinstance(form, ak.forms.IndexedOptionForm):
+            index = np.asarray(buffers[f"{key}-index"])
+            base = self._node_lengths.get(key, 0)
+            self._append(f"{key}-index", np.where(index < 0, index, index + base))
+            self._node_lengths[key] = base + node_length(form.content, buffers)
+            self._append_node(form.content, buffers)
+        elif isinstance(form, ak.forms.ByteMaskedForm):
+            self._append_data(f"{key}-mask", buffers[f"{key}-mask"])
+            self._append_node(form.content, buffers)
+        elif isinstance(form, (ak.forms.RegularForm, ak.forms.UnmaskedForm)):
+            self._append_node(form.content, buffers)
+        elif isinstance(form, ak.forms.RecordForm):
+            for content in form.contents:
+                self._append_node(content, buffers)
+        elif isinstance(form, ak.forms.EmptyForm):
+            pass
+        else:
+            error_message = f"Streaming {type(form).__name__} is not supported."
+            raise NotImplementedError(error_message)
+
+    def _append_data(self, name, data):
+        if not self.virtual:
+            self._append(name, data)
+            return
+        if isinstance(data, h5py.Dataset) and data.file != self.file:
+            path = os.path.relpath(
+                Path(data.file.filename).resolve(),
+                Path(self.file.filename).resolve().parent,
+            )
+        else:
+            # Buffers that only exist in memory (e.g. after a type conversion)
+            # are stored in the output file and mapped like any other source.
+            sources = self.file.require_group(f"{self.group.name}_sources")
+            data = np.asarray(data)
+            options = self._options(data, resizable=False) if len(data) else {}
+            data = sources.create_dataset(str(len(sources)), data=data, **options)
+            path = "."
+        if len(data):
+            source = h5py.VirtualSource(path, data.name, data.shape, data.dtype)
+            self._sources.setdefault(name, []).append(source)
+
+    def _create_virtual(self, name, sources):
+        length = sum(source.shape[0] for source in sources)
+        layout = h5py.VirtualLayout(shape=(length,), dtype=sources[0].dtype)
+        start = 0
+        for source in sources:
+            layout[start : start + source.shape[0]] = source
+            start += source.shape[0]
+        self.group.create_virtual_dataset(name, layout)
+
+    def _options(self, data, resizable=True):
+        options = {k: v for k, v in self.dataset_options.items() if v is not None}
+        options["chunks"] = True
+        if self.chunk_events and len(data) and self._batch_length:
+            # Entries of this buffer per event, taken from the batch that
+            # creates the dataset.
+            per_event = len(data) / self._batch_length
+            chunk = max(1, round(self.chunk_events * per_event))
+            # Chunks of fixed-size datasets cannot exceed the data.
+            options["chunks"] = (chunk if resizable else min(chunk, len(data)),)
+        return options
+
+    def _append(self, name, data):
+        data = np.asarray(data)
+        if name not in self.group:
+            if not len(data):
+                # Created with the first data or, if there is none, on close.
+                return
+            self.group.create_dataset(
+                name, data=data, maxshape=(None,), **self._options(data)
+            )
+            return
+        dataset = self.group[name]
+        start = dataset.shape[0]
+        dataset.resize((start + len(data),))
+        dataset[start:] = data
+
+    def close(self):
+        if self.file is None:
+            return
+        for name, sources in self._sources.items():
+            self._create_virtual(name, sources)
+        if self.form is not None:
+            # Buffers without data in any source (e.g. lists that are empty
+            # in every batch) are not mapped, but still need a dataset.
+            for name, dtype in _buffer_dtypes(self.form, {}).items():
+                if name not in self.group:
+                    self.group.create_dataset(name, shape=(0,), dtype=dtype)
+            self.group.attrs["form"] = self.form.to_json()
+            self.group.attrs["length"] = self.length
+        self.file.close()
+        self.file = None
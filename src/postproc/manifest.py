@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from misc import EXECUTION_PARA, package_version
+
+MANIFEST_VERSION = 1
+
+
+def file_checksum(path, chunk_size=1 << 24):
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def instruction_hash(inst):
+    """
+    Hash of the parts of the instructions that determine the outputs.
+
+    Run settings (threads, caching, telemetry, ...) and the folders are
+    left out. Files named in module parameters, such as the dead-layer
+    geometry, enter with their size and modification time.
+    """
+    para = {k: v for k, v in inst["para"].items() if k not in EXECUTION_PARA}
+    files = {}
+    for p_inst in inst["instr"]:
+        for value in p_inst.get("para", {}).values():
+            if isinstance(value, str) and Path(value).is_file():
+                stat = Path(value).stat()
+                files[value] = [stat.st_size, stat.st_mtime_ns]
+    relevant = {
+        "format": inst["io"]["input"]["format"],
+        "storage": inst["io"].get("storage", {}),
+        "input": inst["input"],
+        "para": para,
+        "instr": [
+            {
+                **p_inst,
+                "para": {
+                    k: v
+                    for k, v in p_inst.get("para", {}).items()
+                    if k not in EXECUTION_PARA
+                },
+            }
+            for p_inst in inst["instr"]
+        ],
+        "output": inst["output"],
+        "files": files,
+    }
+    return hashlib.sha256(
+        json.dumps(relevant, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class manifest:
+    """
+    Record of how every output in a folder was produced.
+
+    An entry per output file stores the size and modification time of its
+    input, the hash of the instructions and the package version. An output
+    is current if all of these still match. Inputs are only hashed when their
+    modification time changed but their size did not: if the SHA-256
+    checksum matches the one stored in the entry, the input is accepted,
+    otherwise the checksum is stored with the entry of the new output.
+    """
+
+    def __init__(self, file, inst):
+        self.file = Path(file)
+        self.instructions = instruction_hash(inst)
+        self.version = package_version()
+        try:
+            content = json.loads(self.file.read_text())
+        except (OSError, ValueError):
+            content = {}
+        if content.get("manifest_version") != MANIFEST_VERSION:
+            content = {}
+        self.entries = content.get("outputs", {})
+        # Per-file outputs the summary was built from, in summarize mode.
+        self.summary = content.get("summary")
+        self.changed = False
+        # Checksums computed by is_current, by input: (mtime_ns, sha256).
+        self.checksums = {}
+
+    def is_current(self, infile, outfile):
+        entry = self.entries.get(Path(outfile).name)
+        if entry is None or not Path(outfile).exists():
+            return False
+        if (
+            entry["instructions"] != self.instructions
+            or entry["version"] != self.version
+        ):
+            return False
+        stat = Path(infile).stat()
+        if (
+            entry["input"] != str(Path(infile).resolve())
+            or entry["size"] != stat.st_size
+        ):
+            return False
+        if entry["mtime_ns"] != stat.st_mtime_ns:
+            checksum = file_checksum(infile)
+            self.checksums[entry["input"]] = (stat.st_mtime_ns, checksum)
+            if entry.get("sha256") != checksum:
+                return False
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self.changed = True
+        return True
+
+    def record(self, infile, outfile):
+        stat = Path(infile).stat()
+        infile = str(Path(infile).resolve())
+        mtime_ns, checksum = self.checksums.get(infile, (None, None))
+        self.entries[Path(outfile).name] = {
+            "input": infile,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": checksum if mtime_ns == stat.st_mtime_ns else None,
+            "instructions": self.instructions,
+            "version": self.version,
+        }
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_file.write_text(
+            json.dumps(
+                {
+                    "manifest_version": MANIFEST_VERSION,
+                    "outputs": self.entries,
+                    "summary": self.summary,
+                },
+                indent=1,
+                sort_keys=True,
+            )
+        )
+        tmp_file.replace(self.file)
+        self.changed = False
@@ -1,9 +1,32 @@
 from __future__ import annotations
 
 import json
+from importlib.metadata import PackageNotFoundError, version
 from pathlib import Path
 
+# Run parameters that do not change the results of a module.
+EXECUTION_PARA = {
+    "cache",
+    "entries_per_task",
+    "geometry_cache",
+    "min_task_size",
+    "mode",
+    "module_threads",
+    "step_size",
+    "summarize_layout",
+    "telemetry",
+    "threads",
+    "warmup",
+}
+
 
 def load_inst(file):
     with Path.open(file) as f:
         return json.load(f)
+
+
+def package_version():
+    try:
+        return version("postproc")
+    except PackageNotFoundError:
+        return "unknown"
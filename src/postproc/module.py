@@ -1,6 +1,47 @@
 from __future__ import annotations
 
-import modules as mod
+import importlib
+from functools import lru_cache
+from importlib.metadata import entry_points
+
+# Built-in modules as "<python module>:<function>". They are imported on
+# first use, so a pipeline only loads the modules (and kernels) it needs.
+MODULES = {
+    "active_volume": "modules.active_volume:m_active_volume",
+    "coincidence_window": "modules.coincidence_window:m_coincidence_window",
+    "group_sensitive_volume": "modules.group_sensitive_volume:m_group_sensitive_volume",
+    "r90_estimator": "modules.r90_estimator:m_r90_estimator",
+    "sum_energy": "modules.sum_energy:m_sum_energy",
+    "threshold": "modules.threshold:m_threshold",
+    "window": "modules.window:m_window",
+}
+# Entry point group of modules provided by other packages.
+ENTRY_POINT_GROUP = "postproc.modules"
+
+
+def _plugin_entry_points():
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return eps.select(group=ENTRY_POINT_GROUP)
+    return eps.get(ENTRY_POINT_GROUP, [])
+
+
+@lru_cache(maxsize=None)
+def load_module(name):
+    """
+    Resolve a module name to its function.
+
+    Built-in modules take precedence over modules registered by other
+    packages in the "postproc.modules" entry point group.
+    """
+    if name in MODULES:
+        module_path, function = MODULES[name].split(":")
+        return getattr(importlib.import_module(module_path), function)
+    for ep in _plugin_entry_points():
+        if ep.name == name:
+            return ep.load()
+    error_message = f"{name} not defined."
+    raise NotImplementedError(error_message)
 
 
 class module:
@@ -13,22 +54,7 @@ class module:
         self.module = self._get_module(self.module_name)
 
     def _get_module(self, module):
-        if module == "group_sensitive_volume":
-            return mod.m_group_sensitive_volume
-        if module == "window":
-            return mod.m_window
-        if module == "active_volume":
-            return mod.m_active_volume
-        if module == "sum_energy":
-            return mod.m_sum_energy
-        if module == "r90_estimator":
-            return mod.m_r90_estimator
-        if module == "coincidence_window":
-            return mod.m_coincidence_window
-        if module == "threshold":
-            return mod.m_threshold
-        error_message = f"{module} not defined."
-        raise NotImplementedError(error_message)
+        return load_module(module)
 
     def run(self, processing_variables):
         self.module(self.para, self.input, self.output, processing_variables)
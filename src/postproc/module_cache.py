@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+
+
+def cache_dir():
+    return Path(
+        os.environ.get("POSTPROC_CACHE_DIR", Path.home() / ".cache" / "postproc")
+    )
+
+
+class module_cache:
+    """
+    On-disk store of module outputs, addressed by a content hash.
+
+    Every entry holds the outputs of one module for one batch as awkward
+    buffers in an uncompressed .npz file. Reading an entry refreshes its
+    modification time; when the cache grows beyond max_size bytes, the
+    least recently used entries are removed until it is below 90% of
+    max_size. The size of the cache is tracked while writing, the
+    directory is only scanned on the first write and when evicting.
+    """
+
+    def __init__(self, directory=None, max_size=10 * 1024**3):
+        self.directory = Path(directory) if directory else cache_dir() / "modules"
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._size = None
+
+    def path(self, key):
+        return self.directory / f"{key}.npz"
+
+    def __contains__(self, key):
+        return self.path(key).exists()
+
+    def get(self, key, names):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                values = {}
+                for i, name in enumerate(names):
+                    form = ak.forms.from_json(str(data[f"{i}/form"]))
+                    prefix = f"{i}/"
+                    buffers = {
+                        k[len(prefix) :]: data[k]
+                        for k in data.files
+                        if k.startswith(prefix)
+                    }
+                    values[name] = ak.from_buffers(
+                        form, int(data[f"{i}/length"]), buffers
+                    )
+        except (OSError, KeyError, ValueError):
+            return None
+        os.utime(path)
+        return values
+
+    def put(self, key, values):
+        arrays = {}
+        for i, value in enumerate(values):
+            form, length, buffers = ak.to_buffers(ak.to_packed(ak.Array(value)))
+            arrays[f"{i}/form"] = np.array(form.to_json())
+            arrays[f"{i}/length"] = np.array(length)
+            arrays.update({f"{i}/{k}": v for k, v in buffers.items()})
+        path = self.path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npz")
+        try:
+            np.savez(tmp_path, **arrays)
+            size = tmp_path.stat().st_size
+            tmp_path.replace(path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            return
+        if self._size is None:
+            self._size = self.disk_usage()
+        else:
+            # Entries written by other processes are counted on the next scan.
+            self._size += size
+        if self._size > self.max_size:
+            self.evict(keep=path)
+
+    def disk_usage(self):
+        return sum(entry[1] for entry in self._entries())
+
+    def _entries(self, keep=None):
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            if ".tmp." in path.name or path == keep:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        entries = self._entries(keep)
+        size = sum(entry[1] for entry in entries)
+        if keep is not None and keep.exists():
+            size += keep.stat().st_size
+        if size > self.max_size:
+            target = 0.9 * self.max_size
+            for _, entry_size, path in sorted(entries):
+                if size <= target:
+                    break
+                path.unlink(missing_ok=True)
+                size -= entry_size
+        self._size = size
+
+
+def file_identity(path):
+    # Files are identified by path, size and modification time.
+    path = Path(path).resolve()
+    stat = path.stat()
+    return [str(path), stat.st_size, stat.st_mtime_ns]
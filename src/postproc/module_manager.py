@@ -1,6 +1,20 @@
 from __future__ import annotations
 
+import hashlib
+import heapq
+import json
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from misc import EXECUTION_PARA, package_version
 from module import module
+from module_cache import file_identity, module_cache
+from telemetry import telemetry
+
+# Helpers shared by the modules in the modules package, which enter the cache
+# key of every module next to the module's own source.
+SHARED_SOURCES = ("jagged.py", "kernels.py")
 
 
 class module_manager:
@@ -9,15 +23,225 @@ class module_manager:
         for p_inst in inst["instr"]:
             p_inst_local = p_inst.copy()
             if "para" in p_inst_local:
-                p_inst_local["para"].update(inst["para"])
+                p_inst_local["para"] = {**p_inst_local["para"], **inst["para"]}
             else:
                 p_inst_local["para"] = inst["para"]
             self.module_list.append(module(p_inst_local))
+        self.module_threads = inst["para"].get("module_threads", 1)
+        self.telemetry = telemetry(enabled=bool(inst["para"].get("telemetry")))
+        self.input_vars = inst["input"]["var"]
+        self.outputs = inst["output"]
+        self.build_graph(self.input_vars, self.outputs)
+
+        # para "cache": true, or {"dir": <directory>, "max_size": <bytes>}
+        self.cache = None
+        cache = inst["para"].get("cache")
+        if cache:
+            options = cache if isinstance(cache, dict) else {}
+            self.cache = module_cache(
+                options.get("dir"), options.get("max_size", 10 * 1024**3)
+            )
+            self.config_keys = [self.config_key(proc) for proc in self.module_list]
+        self._file_ids = {}
+
+    def build_graph(self, input_names, output_names):
+        """
+        Derive the module dependencies from their input and output names.
+
+        Every variable must be produced exactly once, either by the input
+        file or by a single module, and every module input and requested
+        output must be produced somewhere. Modules are ordered topologically,
+        keeping the order of the instruction file where it is not constrained.
+        """
+        producers = dict.fromkeys(input_names)
+        for i, proc in enumerate(self.module_list):
+            for name in proc.output:
+                if name in producers:
+                    source = producers[name]
+                    source = (
+                        "the input" if source is None else self.module_list[source].name
+                    )
+                    error_message = (
+                        f"Output '{name}' of module '{proc.name}' is already "
+                        f"produced by {source}."
+                    )
+                    raise ValueError(error_message)
+                producers[name] = i
+        self.producers = producers
+
+        self.dependencies = []
+        self.dependents = [[] for _ in self.module_list]
+        for i, proc in enumerate(self.module_list):
+            missing = [name for name in proc.input if name not in producers]
+            if missing:
+                error_message = (
+                    f"Inputs {missing} of module '{proc.name}' are never produced."
+                )
+                raise ValueError(error_message)
+            dependencies = {producers[name] for name in proc.input} - {None}
+            self.dependencies.append(dependencies)
+            for j in dependencies:
+                self.dependents[j].append(i)
+        missing = [name for name in output_names if name not in producers]
+        if missing:
+            error_message = f"Requested outputs {missing} are never produced."
+            raise ValueError(error_message)
+
+        remaining = [len(dependencies) for dependencies in self.dependencies]
+        ready = [i for i, n in enumerate(remaining) if n == 0]
+        heapq.heapify(ready)
+        self.order = []
+        self.order_index = []
+        while ready:
+            i = heapq.heappop(ready)
+            self.order.append(self.module_list[i])
+            self.order_index.append(i)
+            for j in self.dependents[i]:
+                remaining[j] -= 1
+                if remaining[j] == 0:
+                    heapq.heappush(ready, j)
+        if len(self.order) < len(self.module_list):
+            cycle = [
+                proc.name for i, proc in enumerate(self.module_list) if remaining[i]
+            ]
+            error_message = f"Modules {cycle} are part of or depend on a cycle."
+            raise ValueError(error_message)
+
+    def warmup(self):
+        # Compile the kernels of all modules in the pipeline, returns seconds.
+        # Imported here so that pipelines without kernels do not load numba.
+        from modules.kernels import warmup  # noqa: PLC0415
+
+        with self.telemetry.span("warmup", "jit"):
+            return warmup([proc.module_name for proc in self.module_list])
+
+    def config_key(self, proc):
+        # Hash of everything that determines a module's results apart from
+        # its inputs: configuration, source code (with the shared helpers and
+        # the package version) and files named in para.
+        para = {k: v for k, v in proc.para.items() if k not in EXECUTION_PARA}
+        files = [
+            file_identity(v)
+            for v in para.values()
+            if isinstance(v, str) and Path(v).is_file()
+        ]
+        source = getattr(sys.modules.get(proc.module.__module__), "__file__", None)
+        if source:
+            sources = [Path(source)]
+            sources += [
+                path
+                for path in (Path(source).with_name(name) for name in SHARED_SOURCES)
+                if path.is_file()
+            ]
+            code = [hashlib.sha256(path.read_bytes()).hexdigest() for path in sources]
+        else:
+            code = proc.module.__qualname__
+        config = {
+            "module": proc.module_name,
+            "input": proc.input,
+            "output": proc.output,
+            "para": para,
+            "files": files,
+            "code": code,
+            "version": package_version(),
+        }
+        return hashlib.sha256(
+            json.dumps(config, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def batch_keys(self, batch):
+        """
+        Cache keys of all modules for one batch (input file, entry range).
+
+        The key of a module covers its configuration and, for every input,
+        either the input branch and batch or the key of the producing module,
+        so a change invalidates the module and everything downstream of it.
+        """
+        infile, entry_start, entry_stop = batch
+        if infile not in self._file_ids:
+            self._file_ids[infile] = file_identity(infile)
+        batch_id = [self._file_ids[infile], entry_start, entry_stop]
+        keys = [None] * len(self.module_list)
+        for i in self.order_index:
+            proc = self.module_list[i]
+            sources = [
+                [self.input_vars[name], batch_id]
+                if self.producers[name] is None
+                else keys[self.producers[name]]
+                for name in proc.input
+            ]
+            keys[i] = hashlib.sha256(
+                json.dumps([self.config_keys[i], sources], default=str).encode()
+            ).hexdigest()
+        return keys
+
+    def load_cached(self, processing_variables, keys):
+        # Load the cached outputs that are needed, returns the modules to run.
+        missing = {i for i, key in enumerate(keys) if key not in self.cache}
+        loaded = set()
+        while True:
+            needed = set(self.outputs).union(
+                *(self.module_list[i].input for i in missing)
+            )
+            for i in self.order_index:
+                proc = self.module_list[i]
+                if i in missing or i in loaded or not needed & set(proc.output):
+                    continue
+                with self.telemetry.span(proc.name, "cache"):
+                    values = self.cache.get(keys[i], proc.output)
+                if values is None:
+                    # Unreadable entry: run the module, which may need more inputs.
+                    missing.add(i)
+                    break
+                processing_variables.update(values)
+                loaded.add(i)
+            else:
+                return missing
+
+    def run(self, processing_variables, pbar, task_id, batch=None):
+        with self.telemetry.span("batch", "batch"):
+            if self.cache is None or batch is None:
+                self._run(processing_variables, pbar, task_id)
+                return
+            keys = self.batch_keys(batch)
+            to_run = self.load_cached(processing_variables, keys)
+            self._run(processing_variables, pbar, task_id, to_run)
+            for i in to_run:
+                proc = self.module_list[i]
+                self.cache.put(keys[i], [processing_variables[n] for n in proc.output])
+
+    def _run(self, processing_variables, pbar, task_id, to_run=None):
+        if to_run is None:
+            to_run = set(range(len(self.module_list)))
+        if self.module_threads <= 1:
+            for i in self.order_index:
+                if i not in to_run:
+                    continue
+                proc = self.module_list[i]
+                pbar.set_description(f"{task_id} - {proc.name}")
+                self.telemetry.run_module(proc, processing_variables)
+            return
 
-    def run(self, processing_variables, pbar, task_id):
-        for proc in (
-            self.module_list
-        ):  # tqdm(self.module_list, desc="Processing", unit="proc"):
-            # tqdm.write(f"Running: {proc.name}")  # Display the name of the current process
-            pbar.set_description(f"{task_id} - {proc.name}")
-            proc.run(processing_variables)
+        # Modules are submitted as soon as all their inputs are available.
+        remaining = [len(dependencies & to_run) for dependencies in self.dependencies]
+        ready = [i for i in to_run if remaining[i] == 0]
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.module_threads) as executor:
+            while ready or running:
+                for i in ready:
+                    future = executor.submit(
+                        self.telemetry.run_module,
+                        self.module_list[i],
+                        processing_variables,
+                    )
+                    running[future] = i
+                ready = []
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    future.result()
+                    pbar.set_description(f"{task_id} - {self.module_list[i].name}")
+                    for j in self.dependents[i]:
+                        remaining[j] -= 1
+                        if remaining[j] == 0 and j in to_run:
+                            ready.append(j)
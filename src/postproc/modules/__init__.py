@@ -1,19 +1,22 @@
 from __future__ import annotations
 
-from .active_volume import m_active_volume
-from .coincidence_window import m_coincidence_window
-from .group_sensitive_volume import m_group_sensitive_volume
-from .r90_estimator import m_r90_estimator
-from .sum_energy import m_sum_energy
-from .threshold import m_threshold
-from .window import m_window
+from module import MODULES, load_module
 
-__all__ = [
-    "m_active_volume",
-    "m_group_sensitive_volume",
-    "m_r90_estimator",
-    "m_sum_energy",
-    "m_window",
-    "m_coincidence_window",
-    "m_threshold",
-]
+# The module functions m_<name> are resolved through the module registry on
+# first access, so that using one of them does not load the others (and their
+# kernels).
+__all__ = [f"m_{name}" for name in sorted(MODULES)]
+
+
+def __getattr__(name):
+    if name.startswith("m_"):
+        try:
+            return load_module(name[2:])
+        except NotImplementedError:
+            pass
+    error_message = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(error_message)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,138 +1,178 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import zipfile
 from pathlib import Path
 
 import awkward as ak
 import numpy as np
-from numba import njit, types
-from numba.typed import Dict
 
+from .jagged import counts_to_offsets, flatten_jagged, unflatten_jagged
+from .kernels import cylinder_mask, deadlayer_mask
+
+# Parsed dead-layer geometries of this process, keyed by (path, mtime, size).
+_geometry_cache = {}
+# Bumped whenever the arrays stored in the binary geometry cache change.
+GEOMETRY_CACHE_VERSION = 3
+GEOMETRY_ARRAYS = (
+    "vol_ids",
+    "centers",
+    "mesh_offsets",
+    "r_dl",
+    "z_dl",
+    "z_min",
+    "z_max",
+    "z_sorted",
+)
 
-def generate_mask_cylinder(x, y, z, para):
-    r = np.sqrt(x**2 + y**2)
-    mask = ak.ones_like(x)
-    mask = mask - (r > para["conditions"]["r"])
-    mask = mask - ((z > para["conditions"]["h1"]) + (z < para["conditions"]["h2"]))
-
-    inverse = False
-    if "inverse" in para:
-        inverse = para["inverse"]
-
-    if inverse:
-        return mask < 1
-    return mask > 0
-
-
-@njit
-def is_point_inside_polycone(x, y, z, r_values, z_values):
-    # Step 1: Convert (x, y, z) to cylindrical coordinates (r, z)
-    r_point = np.sqrt(x**2 + y**2)
-
-    # Step 2: Check if the z-coordinate is within the z-range of the polycone
-    if z < min(z_values) or z > max(z_values):
-        return False  # Point is outside based on z
-
-    # Step 3: Determine which segment of the polycone the z value falls into
-    for i in range(len(z_values) - 1):
-        z_low, z_high = z_values[i], z_values[i + 1]
-        r_low, r_high = r_values[i], r_values[i + 1]
-
-        if z_low <= z <= z_high:
-            # Step 4: Interpolate the radius at the point's z value
-            t = (z - z_low) / (
-                z_high - z_low
-            )  # Normalized z position between z_low and z_high
-            r_interp = r_low + t * (r_high - r_low)  # Linear interpolation of r
-
-            # Step 5: Check if the point's radial distance is less than the interpolated radius
-            return r_point <= r_interp
 
-    return False  # Point is outside
+def generate_mask_cylinder(x, y, z, para):
+    x_flat, counts = flatten_jagged(x)
+    mask = np.empty(len(x_flat), dtype=np.bool_)
+    cylinder_mask(
+        np.ascontiguousarray(x_flat, dtype=np.float64),
+        np.ascontiguousarray(ak.flatten(y, axis=None), dtype=np.float64),
+        np.ascontiguousarray(ak.flatten(z, axis=None), dtype=np.float64),
+        float(para["conditions"]["r"]),
+        float(para["conditions"]["h1"]),
+        float(para["conditions"]["h2"]),
+        bool(para.get("inverse", False)),
+        mask,
+    )
+    return unflatten_jagged(mask, counts)
+
+
+def parse_deadlayer_geometry(dl_input):
+    # Flat representation of the dead-layer meshes: volumes sorted by ID,
+    # their centers and the concatenated r/z meshes with per-volume offsets.
+    volumes = sorted((int(vol_key), value) for vol_key, value in dl_input.items())
+    r_dl = [
+        np.asarray(v["surface_mesh"]["dl"]["r"], dtype=np.float64) for _, v in volumes
+    ]
+    z_dl = [
+        np.asarray(v["surface_mesh"]["dl"]["z"], dtype=np.float64) for _, v in volumes
+    ]
+    mesh_offsets = counts_to_offsets([len(r) for r in r_dl])
+    return {
+        "vol_ids": np.array([vol for vol, _ in volumes], dtype=np.int64),
+        "centers": np.array(
+            [v["center"] for _, v in volumes], dtype=np.float64
+        ).reshape(-1, 3),
+        "mesh_offsets": mesh_offsets,
+        "r_dl": np.concatenate(r_dl) if r_dl else np.zeros(0),
+        "z_dl": np.concatenate(z_dl) if z_dl else np.zeros(0),
+        "z_min": np.array([z.min() if len(z) else np.inf for z in z_dl]),
+        "z_max": np.array([z.max() if len(z) else -np.inf for z in z_dl]),
+        "z_sorted": np.array([bool(np.all(np.diff(z) >= 0)) for z in z_dl]),
+    }
+
+
+def geometry_cache_dir(cache=None):
+    # Directory of the binary geometry cache: para "geometry_cache" (a path,
+    # or True for the default), else $POSTPROC_CACHE_DIR. None disables it.
+    if isinstance(cache, (str, os.PathLike)):
+        return Path(cache)
+    if cache:
+        return Path(
+            os.environ.get("POSTPROC_CACHE_DIR", Path.home() / ".cache" / "postproc")
+        )
+    if "POSTPROC_CACHE_DIR" in os.environ:
+        return Path(os.environ["POSTPROC_CACHE_DIR"])
+    return None
 
 
-@njit
-def is_in_active_volume(x, y, z, vol, dl_input):
-    pos = dl_input[vol]["center"]
-    r_dl = dl_input[vol]["r_dl"]
-    z_dl = dl_input[vol]["z_dl"]
-    return is_point_inside_polycone(x - pos[0], y - pos[1], z - pos[2], r_dl, z_dl)
+def load_deadlayer_geometry(file, cache=None):
+    """
+    Load the dead-layer geometry of a JSON file as flat arrays.
+
+    The result is kept in memory for the lifetime of the process and
+    reused as long as the file's modification time and size are unchanged.
+    With a cache directory (see geometry_cache_dir), the parsed geometry is
+    also stored there as a binary .npz file per JSON path, along with the
+    size, modification time and SHA-256 hash of the JSON. The JSON is only
+    read and hashed again if its size or modification time changed.
+    """
+    path = Path(file).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    if key in _geometry_cache:
+        return _geometry_cache[key]
+
+    cache_dir = geometry_cache_dir(cache)
+    if cache_dir is None:
+        geometry = parse_deadlayer_geometry(json.loads(path.read_bytes()))
+    else:
+        geometry = _load_cached_geometry(path, stat, cache_dir)
+
+    for stale in [k for k in _geometry_cache if k[0] == key[0]]:
+        del _geometry_cache[stale]
+    _geometry_cache[key] = geometry
+    return geometry
+
+
+def _load_cached_geometry(path, stat, cache_dir):
+    cache_file = cache_dir / (
+        f"deadlayer-v{GEOMETRY_CACHE_VERSION}-"
+        f"{hashlib.sha256(str(path).encode()).hexdigest()}.npz"
+    )
+    try:
+        with np.load(cache_file) as data:
+            cached = {name: data[name] for name in data.files}
+    except (OSError, ValueError, zipfile.BadZipFile):
+        cached = {}
+    if not set(GEOMETRY_ARRAYS) | {"size", "mtime_ns", "sha256"} <= set(cached):
+        cached = None
+    elif (int(cached["size"]), int(cached["mtime_ns"])) == (
+        stat.st_size,
+        stat.st_mtime_ns,
+    ):
+        return {name: cached[name] for name in GEOMETRY_ARRAYS}
+
+    content = path.read_bytes()
+    checksum = hashlib.sha256(content).hexdigest()
+    if cached is not None and str(cached["sha256"]) == checksum:
+        geometry = {name: cached[name] for name in GEOMETRY_ARRAYS}
+    else:
+        geometry = parse_deadlayer_geometry(json.loads(content))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp_file,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            sha256=checksum,
+            **geometry,
+        )
+        tmp_file.replace(cache_file)
+    except OSError:
+        pass
+    return geometry
 
 
 def generate_mask_deadlayer(x, y, z, vol, para):
-    with Path.open(para["file"]) as f:
-        dl_input = json.load(f)
-
-    def convert_to_numba_dict(py_dict):
-        # Create the outer numba.typed.Dict
-        nb_dict = Dict.empty(
-            key_type=types.int64,
-            value_type=types.DictType(types.unicode_type, types.float64[:]),
-        )
-
-        for vol_key, vol_value in py_dict.items():
-            # Create the inner dictionary for each volume (flatten surface_mesh fields)
-            vol_dict = Dict.empty(
-                key_type=types.unicode_type, value_type=types.float64[:]
-            )
-
-            # Convert "center" to a numpy array
-            center_array = np.array(vol_value["center"], dtype=np.float64)
-            vol_dict["center"] = center_array
-
-            # Flatten "surface_mesh.orig.r", "surface_mesh.orig.z", "surface_mesh.dl.r", and "surface_mesh.dl.z"
-            r_orig_array = np.array(
-                vol_value["surface_mesh"]["orig"]["r"], dtype=np.float64
-            )
-            z_orig_array = np.array(
-                vol_value["surface_mesh"]["orig"]["z"], dtype=np.float64
-            )
-            r_dl_array = np.array(
-                vol_value["surface_mesh"]["dl"]["r"], dtype=np.float64
-            )
-            z_dl_array = np.array(
-                vol_value["surface_mesh"]["dl"]["z"], dtype=np.float64
-            )
-
-            # Store the flattened arrays into the vol_dict
-            vol_dict["r_orig"] = r_orig_array
-            vol_dict["z_orig"] = z_orig_array
-            vol_dict["r_dl"] = r_dl_array
-            vol_dict["z_dl"] = z_dl_array
-
-            # Store vol_dict inside the nb_dict with the integer key
-            nb_dict[int(vol_key)] = vol_dict
-
-        return nb_dict
-
-    dl_input_numba = convert_to_numba_dict(dl_input)
-
-    @njit
-    def _internal(x, y, z, vol, dl_input):
-        output = []
-        for i in range(len(x)):  # event
-            tmp = []
-            for j in range(len(x[i])):  # window
-                tmp2 = []
-                for k in range(len(x[i][j])):  # detector
-                    tmp3 = []
-                    for m in range(len(x[i][j][k])):  # hit
-                        if vol[i][j][k][m] > 1000000:
-                            tmp3.append(
-                                is_in_active_volume(
-                                    x[i][j][k][m],
-                                    y[i][j][k][m],
-                                    z[i][j][k][m],
-                                    vol[i][j][k][m],
-                                    dl_input,
-                                )
-                            )
-                    tmp2.append(tmp3)
-                tmp.append(tmp2)
-            output.append(tmp)
-        return output
-
-    return ak.Array(_internal(x, y, z, vol, dl_input_numba))
+    geometry = load_deadlayer_geometry(para["file"], para.get("geometry_cache"))
+
+    vol_flat = ak.to_numpy(ak.flatten(vol, axis=None))
+    checked = np.unique(vol_flat[vol_flat > 1000000])
+    missing = checked[~np.isin(checked, geometry["vol_ids"])]
+    if len(missing):
+        error_message = f"No dead-layer geometry for volumes {missing.tolist()}."
+        raise KeyError(error_message)
+
+    x_flat, counts = flatten_jagged(x)
+    mask = np.empty(len(x_flat), dtype=np.bool_)
+    deadlayer_mask(
+        np.ascontiguousarray(x_flat, dtype=np.float64),
+        np.ascontiguousarray(ak.flatten(y, axis=None), dtype=np.float64),
+        np.ascontiguousarray(ak.flatten(z, axis=None), dtype=np.float64),
+        np.ascontiguousarray(vol_flat, dtype=np.int64),
+        tuple(geometry[name] for name in GEOMETRY_ARRAYS),
+        mask,
+    )
+    return unflatten_jagged(mask, counts)
 
 
 def m_active_volume(para, input, output, pv):
@@ -144,6 +184,10 @@ def m_active_volume(para, input, output, pv):
     Parameters:
     para (dict): Dictionary containing parameters for the module.
         - active_threshold (float): Threshold for active volume.
+        - geometry_cache (str or bool, optional): Directory of the binary
+          dead-layer geometry cache, True for $POSTPROC_CACHE_DIR or
+          ~/.cache/postproc. Without it, the cache is only used if
+          $POSTPROC_CACHE_DIR is set.
 
     input (list): List of input parameters in the following order:
         - t: Name of times array.
@@ -200,18 +244,18 @@ def m_active_volume(para, input, output, pv):
         mask = generate_mask_cylinder(
             pv[in_n["posx"]], pv[in_n["posy"]], pv[in_n["posz"]], para
         )
-        tmp = pv[in_n["edep"]][mask]
-        mask_tmp = ak.Array([[True for arr2 in arr1 if len(arr2)] for arr1 in tmp])
-        pv[out_n["edep"]] = tmp[mask_tmp]
-        pv[out_n["w_t"]] = pv[in_n["w_t"]][ak.any(mask, axis=-1)]
+        # Windows without any remaining hit are removed.
+        keep = ak.any(mask, axis=-1)
+        pv[out_n["edep"]] = pv[in_n["edep"]][mask][keep]
+        pv[out_n["w_t"]] = pv[in_n["w_t"]][keep]
 
     if para["type"] == "deadlayer":
         mask = generate_mask_deadlayer(
             pv[in_n["posx"]], pv[in_n["posy"]], pv[in_n["posz"]], pv[in_n["vol"]], para
         )
-        pv[out_n["vol_red"]] = ak.firsts(pv[in_n["vol"]], axis=-1)
+        # Windows without any detector are removed from all fields.
+        keep = ak.num(mask, axis=2) > 0
+        pv[out_n["vol_red"]] = ak.firsts(pv[in_n["vol"]], axis=-1)[keep]
 
         for key in in_n:
-            tmp = pv[in_n[key]][mask]
-            mask_tmp = ak.Array([[True for arr2 in arr1 if len(arr2)] for arr1 in tmp])
-            pv[out_n[key]] = tmp[mask_tmp]
+            pv[out_n[key]] = pv[in_n[key]][mask][keep]
@@ -3,36 +3,45 @@ from __future__ import annotations
 import awkward as ak
 import numpy as np
 
+from .jagged import counts_to_offsets, flatten_jagged
+from .kernels import coincident_sums
+
 
 def generate_output(wt_m1, wt_m2, val, para):
     t_min = para["t_min"]
     t_max = para["t_max"]
 
-    # @njit
-    def _internal(wt_m1, wt_m2, val, t_min, t_max):
-        output = []
-        for i in range(len(wt_m1)):  # event
-            tmp = []
-            if isinstance(wt_m1[i], ak.Array):
-                for j in range(len(wt_m1[i]) - 2):  # window 1
-                    tmp2 = []
-                    for k in range(len(wt_m2[i]) - 2):  # window 2
-                        if (wt_m2[i][k] > wt_m1[i][j] + t_min) & (
-                            wt_m2[i][k] < wt_m1[i][j] + t_max
-                        ):
-                            tmp2.append(val[i][k])
-                    tmp.append(np.sum(tmp2))
-                output.append(tmp)
-            else:
-                if i >= len(wt_m1) - 1:
-                    break
-                for k in range(len(wt_m2) - 2):  # window 2
-                    if (wt_m2[k] > wt_m1[i] + t_min) & (wt_m2[k] < wt_m1[i] + t_max):
-                        tmp.append(val[k])
-                output.append(np.sum(tmp))
-        return output
-
-    return ak.Array(_internal(wt_m1, wt_m2, val, t_min, t_max))
+    if wt_m1.ndim > 1:
+        # Values per window may carry further dimensions (e.g. detectors),
+        # which are summed up.
+        while val.ndim > 2:
+            val = ak.sum(val, axis=-1)
+        w1, (w1_counts,) = flatten_jagged(wt_m1)
+        w2, (w2_counts,) = flatten_jagged(wt_m2)
+        v, (v_counts,) = flatten_jagged(val)
+        trim1, trim2 = 2, 2
+    else:
+        # A single list of windows, treated as one event.
+        w1, w1_counts = ak.to_numpy(wt_m1), [len(wt_m1)]
+        w2, w2_counts = ak.to_numpy(wt_m2), [len(wt_m2)]
+        v, v_counts = ak.to_numpy(val), [len(val)]
+        trim1, trim2 = 1, 2
+
+    output, counts = coincident_sums(
+        np.ascontiguousarray(w1, dtype=np.float64),
+        counts_to_offsets(w1_counts),
+        np.ascontiguousarray(w2, dtype=np.float64),
+        counts_to_offsets(w2_counts),
+        np.ascontiguousarray(v, dtype=np.float64),
+        counts_to_offsets(v_counts),
+        float(t_min),
+        float(t_max),
+        trim1,
+        trim2,
+    )
+    if wt_m1.ndim > 1:
+        return ak.unflatten(output, counts)
+    return ak.Array(output)
 
 
 def m_coincidence_window(para, input, output, pv):
@@ -40,10 +49,12 @@ def m_coincidence_window(para, input, output, pv):
     Coincidence Window module for the postprocessing pipeline.
 
     Given two lists of windowed data, the module calculates the sum of the values in the second window that fall within a time window of the first window.
+    Both lists of window times have to be sorted in ascending order, as produced by the window module.
 
     Parameters:
     para (dict): Dictionary containing parameters for the module.
-        - coincidence_time (float): Time window for coincidence.
+        - t_min (float): Lower edge of the coincidence window, relative to the window start of the first list.
+        - t_max (float): Upper edge of the coincidence window, relative to the window start of the first list.
 
     input (list): List of input parameters in the following order:
         - t: Name of times array.
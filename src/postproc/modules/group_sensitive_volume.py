@@ -1,57 +1,87 @@
 from __future__ import annotations
 
+from functools import lru_cache
+
 import awkward as ak
 import numpy as np
 
+from .jagged import counts_to_offsets, flatten_jagged, unflatten_jagged
+
+# Largest span of volume IDs in a group for a dense membership table.
+MAX_LOOKUP_TABLE_SIZE = 1 << 24
+
+
+@lru_cache(maxsize=None)
+def group_lookup(group, sens_vol_ids, groups):
+    # Membership table of the sensitive volumes in a group: a dense boolean
+    # table indexed by (vol - first ID) if the ID range is small enough,
+    # otherwise the sorted IDs.
+    sv_in_group = np.unique(
+        np.asarray(sens_vol_ids, dtype=np.int64)[np.asarray(groups) == group]
+    )
+    if len(sv_in_group) == 0:
+        return 0, np.zeros(0, dtype=bool), sv_in_group
+    first = sv_in_group[0]
+    if sv_in_group[-1] - first < MAX_LOOKUP_TABLE_SIZE:
+        table = np.zeros(sv_in_group[-1] - first + 1, dtype=bool)
+        table[sv_in_group - first] = True
+        return first, table, None
+    return first, None, sv_in_group
+
 
 def generate_mask(vol, group, sensitive_volumes):
-    sv_in_group = np.array(sensitive_volumes["sensVolID"])[
-        np.array(sensitive_volumes["group"]) == group
+    first, table, sv_in_group = group_lookup(
+        group,
+        tuple(sensitive_volumes["sensVolID"]),
+        tuple(sensitive_volumes["group"]),
+    )
+    vol_flat, counts = flatten_jagged(vol)
+    if table is None:
+        mask = np.isin(vol_flat, sv_in_group)
+    else:
+        index = vol_flat.astype(np.int64) - first
+        in_range = (index >= 0) & (index < len(table))
+        mask = np.zeros(len(vol_flat), dtype=bool)
+        mask[in_range] = table[index[in_range]]
+    return unflatten_jagged(mask, counts)
+
+
+def group_by_detector(v_voln_hw):
+    # Hits are sorted by (window, volume, position) and split into runs of
+    # equal volume per window. The runs of a window are then ordered by the
+    # first hit of each detector, so detectors keep the order in which they
+    # appear in the window. Hits with a negative volume ID are dropped.
+    vol, (windows_per_event, hits_per_window) = flatten_jagged(v_voln_hw)
+    window_id = np.repeat(np.arange(len(hits_per_window)), hits_per_window)
+    index = np.flatnonzero(vol > -1)
+
+    order = np.lexsort((index, vol[index], window_id[index]))
+    sorted_index = index[order]
+    sorted_vol = vol[sorted_index]
+    sorted_window = window_id[sorted_index]
+
+    run_start = np.ones(len(sorted_index), dtype=bool)
+    run_start[1:] = (sorted_window[1:] != sorted_window[:-1]) | (
+        sorted_vol[1:] != sorted_vol[:-1]
+    )
+    run_start = np.flatnonzero(run_start)
+    run_length = np.diff(np.append(run_start, len(sorted_index)))
+    run_window = sorted_window[run_start]
+    run_order = np.lexsort((sorted_index[run_start], run_window))
+
+    hits_per_detector = run_length[run_order]
+    hit_offsets = counts_to_offsets(hits_per_detector)
+    perm = sorted_index[
+        np.repeat(run_start[run_order] - hit_offsets[:-1], hits_per_detector)
+        + np.arange(hit_offsets[-1])
     ]
-    mask = ak.zeros_like(vol)
+    detectors_per_window = np.bincount(run_window, minlength=len(hits_per_window))
+    return perm, [windows_per_event, detectors_per_window, hits_per_detector]
 
-    if isinstance(sv_in_group, int):
-        mask = mask + (vol == sv_in_group)
-    else:
-        for sv in sv_in_group:
-            mask = mask + (vol == sv)
-    return mask > 0
-
-
-# @njit
-def get_detector_ids_in_window(v_voln_hw):
-    list_indices = []
-    for i in range(len(v_voln_hw)):
-        if v_voln_hw[i] not in list_indices and v_voln_hw[i] > -1:
-            list_indices.append(v_voln_hw[i])
-    return list_indices
-
-
-# @njit
-def group_window_into_detector_ids(v_voln_hw, v_in):
-    list_indices = get_detector_ids_in_window(v_voln_hw)
-    output = []
-    for i in range(len(list_indices)):
-        tmp = []
-        for j in range(len(v_in)):
-            if list_indices[i] == v_voln_hw[j]:
-                tmp.append(v_in[j])
-        output.append(tmp)
-    return output
-
-
-def group_all_in_detector_ids(v_voln_hw, v_in):
-    # @njit
-    def _internal(v_voln_hw, v_in):
-        output = []
-        for i in range(len(v_voln_hw)):
-            tmp = []
-            for j in range(len(v_voln_hw[i])):
-                tmp.append(group_window_into_detector_ids(v_voln_hw[i][j], v_in[i][j]))
-            output.append(tmp)
-        return output
-
-    return ak.Array(_internal(v_voln_hw, v_in))
+
+def apply_detector_grouping(grouping, v_in):
+    perm, counts = grouping
+    return unflatten_jagged(ak.to_numpy(ak.flatten(v_in, axis=None))[perm], counts)
 
 
 def m_group_sensitive_volume(para, input, output, pv):
@@ -100,5 +130,6 @@ def m_group_sensitive_volume(para, input, output, pv):
             pv[value] = pv[in_n[key]][mask]
 
     else:
+        grouping = group_by_detector(pv[in_n["vol"]])
         for key, value in out_n.items():
-            pv[value] = group_all_in_detector_ids(pv[in_n["vol"]], pv[in_n[key]])
+            pv[value] = apply_detector_grouping(grouping, pv[in_n[key]])
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import awkward as ak
+import numpy as np
+
+
+def flatten_jagged(array):
+    """
+    Split a jagged array into its flat content and the list counts per level.
+
+    Returns the innermost values as a numpy array and, for every nested
+    level, the flattened number of entries of each list at that depth.
+    """
+    counts = [
+        ak.to_numpy(ak.flatten(ak.num(array, axis=depth), axis=None))
+        for depth in range(1, array.ndim)
+    ]
+    return ak.to_numpy(ak.flatten(array, axis=None)), counts
+
+
+def unflatten_jagged(content, counts):
+    """Inverse of flatten_jagged: wrap flat content with the given list counts."""
+    array = ak.Array(content)
+    for level_counts in reversed(counts):
+        array = ak.unflatten(array, level_counts)
+    return array
+
+
+def counts_to_offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
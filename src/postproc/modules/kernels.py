@@ -0,0 +1,318 @@
+"""
+Compiled kernels of the pipeline modules.
+
+All kernels work on flat numpy content plus int64 offsets and are cached on
+disk by numba. SIGNATURES lists the argument types each kernel is compiled
+for; the module functions convert their inputs accordingly, so warmup() can
+compile everything a pipeline needs before any data is read.
+"""
+
+from __future__ import annotations
+
+import time
+
+import numpy as np
+from numba import njit, types
+
+float_array = types.float64[::1]
+int_array = types.int64[::1]
+bool_array = types.boolean[::1]
+geometry_arrays = types.Tuple(
+    (
+        int_array,  # vol_ids
+        types.float64[:, ::1],  # centers
+        int_array,  # mesh_offsets
+        float_array,  # r_dl
+        float_array,  # z_dl
+        float_array,  # z_min
+        float_array,  # z_max
+        bool_array,  # z_sorted
+    )
+)
+
+
+@njit(cache=True, nogil=True)
+def create_windows(t, t_offsets, dT):
+    # Window starts of each event: the first window opens at 0 and every hit
+    # more than dT after the current window start opens a new window.
+    n_events = len(t_offsets) - 1
+    output = np.empty(len(t) + n_events, dtype=np.float64)
+    counts = np.zeros(n_events, dtype=np.int64)
+    n = 0
+    for i in range(n_events):
+        start = 0.0
+        output[n] = start
+        n += 1
+        counts[i] = 1
+        for y in np.sort(t[t_offsets[i] : t_offsets[i + 1]]):
+            if y > start + dT:
+                start = y
+                output[n] = start
+                n += 1
+                counts[i] += 1
+    return output[:n], counts
+
+
+@njit(cache=True, nogil=True)
+def assign_windows(t, t_offsets, w, w_offsets):
+    # A hit belongs to window j if w[j] <= t < w[j + 1]. Window starts are
+    # sorted per event, so the index is found with a binary search. Hits at
+    # or after the last window start are left unassigned.
+    n_events = len(t_offsets) - 1
+    output = np.empty(len(t), dtype=np.int64)
+    counts = np.zeros(n_events, dtype=np.int64)
+    n = 0
+    for i in range(n_events):
+        w_event = w[w_offsets[i] : w_offsets[i + 1]]
+        for k in range(t_offsets[i], t_offsets[i + 1]):
+            j = np.searchsorted(w_event, t[k], side="right") - 1
+            if j >= 0 and j < len(w_event) - 1:
+                output[n] = j
+                n += 1
+                counts[i] += 1
+    return output[:n], counts
+
+
+@njit(cache=True, nogil=True)
+def group_by_window(mapping, m_offsets, v_offsets, pad_empty):
+    # Stable counting sort of the hits of each event by window index. Entry k
+    # of the mapping pairs with hit k of the event. Windows 0 .. n-1 are
+    # emitted, n being the number of distinct window indices in the event;
+    # empty ones get a single filler hit (index -1) if pad_empty is set.
+    n_events = len(m_offsets) - 1
+    perm = np.empty(2 * len(mapping), dtype=np.int64)
+    window_counts = np.empty(len(mapping), dtype=np.int64)
+    event_counts = np.zeros(n_events, dtype=np.int64)
+    n_hits = 0
+    n_windows = 0
+    for i in range(n_events):
+        m_event = mapping[m_offsets[i] : m_offsets[i + 1]]
+        if len(m_event) == 0:
+            continue
+        hits_per_window = np.zeros(m_event.max() + 1, dtype=np.int64)
+        for m in m_event:
+            hits_per_window[m] += 1
+        n_distinct = np.count_nonzero(hits_per_window)
+        position = np.empty(n_distinct, dtype=np.int64)
+        for j in range(n_distinct):
+            count = hits_per_window[j]
+            position[j] = n_hits
+            if count == 0 and pad_empty:
+                perm[n_hits] = -1
+                count = 1
+            window_counts[n_windows + j] = count
+            n_hits += count
+        for k in range(len(m_event)):
+            j = m_event[k]
+            if j < n_distinct:
+                perm[position[j]] = v_offsets[i] + k
+                position[j] += 1
+        event_counts[i] = n_distinct
+        n_windows += n_distinct
+    return perm[:n_hits], window_counts[:n_windows], event_counts
+
+
+@njit(cache=True, nogil=True)
+def r90_per_detector(edep, x, y, z, offsets):
+    # R90 is the distance from the energy-weighted centroid within which 90%
+    # of the detector's energy is deposited. Detectors without hits or
+    # without deposited energy have no centroid and get R90 = 0.
+    n_detectors = len(offsets) - 1
+    output = np.zeros(n_detectors, dtype=np.float64)
+    for d in range(n_detectors):
+        start, stop = offsets[d], offsets[d + 1]
+        tot_e = 0.0
+        mean_x = 0.0
+        mean_y = 0.0
+        mean_z = 0.0
+        for k in range(start, stop):
+            tot_e += edep[k]
+            mean_x += edep[k] * x[k]
+            mean_y += edep[k] * y[k]
+            mean_z += edep[k] * z[k]
+        if stop == start or tot_e == 0:
+            continue
+        mean_x /= tot_e
+        mean_y /= tot_e
+        mean_z /= tot_e
+
+        dist = np.sqrt(
+            (x[start:stop] - mean_x) ** 2
+            + (y[start:stop] - mean_y) ** 2
+            + (z[start:stop] - mean_z) ** 2
+        )
+        order = np.argsort(dist, kind="mergesort")
+        cumsum_e = 0.0
+        output[d] = dist[order[0]]
+        for k in order:
+            cumsum_e += edep[start + k]
+            if cumsum_e >= 0.9 * tot_e:
+                output[d] = dist[k]
+                break
+    return output
+
+
+@njit(cache=True, nogil=True)
+def coincident_sums(
+    w1, w1_offsets, w2, w2_offsets, val, val_offsets, t_min, t_max, trim1, trim2
+):
+    # For every window start a of the first list, sum the values of the
+    # windows of the second list that start in (a + t_min, a + t_max). Both
+    # lists are sorted, so the bounds of that range only move forward and
+    # are tracked with two pointers over prefix sums of the values. The last
+    # trim1 / trim2 windows of each list are not considered.
+    n_events = len(w1_offsets) - 1
+    counts = np.zeros(n_events, dtype=np.int64)
+    for i in range(n_events):
+        counts[i] = max(0, w1_offsets[i + 1] - w1_offsets[i] - trim1)
+    output = np.zeros(counts.sum(), dtype=np.float64)
+    n = 0
+    for i in range(n_events):
+        start1 = w1_offsets[i]
+        start2 = w2_offsets[i]
+        n2 = max(0, w2_offsets[i + 1] - start2 - trim2)
+        if val_offsets[i + 1] - val_offsets[i] < n2:
+            error_message = "val has fewer windows than the second window list"
+            raise IndexError(error_message)
+        prefix = np.zeros(n2 + 1, dtype=np.float64)
+        for k in range(n2):
+            prefix[k + 1] = prefix[k] + val[val_offsets[i] + k]
+        low = 0
+        high = 0
+        for j in range(counts[i]):
+            a = w1[start1 + j]
+            while low < n2 and w2[start2 + low] <= a + t_min:
+                low += 1
+            while high < n2 and w2[start2 + high] < a + t_max:
+                high += 1
+            if high > low:
+                output[n] = prefix[high] - prefix[low]
+            n += 1
+    return output, counts
+
+
+@njit(cache=True, nogil=True)
+def cylinder_mask(x, y, z, r_max, h1, h2, inverse, output):
+    for h in range(len(x)):
+        inside = not (np.sqrt(x[h] ** 2 + y[h] ** 2) > r_max or z[h] > h1 or z[h] < h2)
+        output[h] = inside != inverse
+
+
+@njit(cache=True, nogil=True)
+def polycone_radius(z, r_low, r_high, z_low, z_high):
+    # Linear interpolation of the radius of a polycone segment at z. A flat
+    # segment (constant z) extends to its outer radius.
+    if z_high == z_low:
+        return max(r_low, r_high)
+    t = (z - z_low) / (z_high - z_low)
+    return r_low + t * (r_high - r_low)
+
+
+@njit(cache=True, nogil=True)
+def is_point_inside_polycone(x, y, z, r_values, z_values):
+    # Step 1: Convert (x, y, z) to cylindrical coordinates (r, z)
+    r_point = np.sqrt(x**2 + y**2)
+
+    # Step 2: Check if the z-coordinate is within the z-range of the polycone
+    if z < min(z_values) or z > max(z_values):
+        return False  # Point is outside based on z
+
+    # Step 3: Determine which segment of the polycone the z value falls into
+    for i in range(len(z_values) - 1):
+        z_low, z_high = z_values[i], z_values[i + 1]
+        r_low, r_high = r_values[i], r_values[i + 1]
+
+        if z_low <= z <= z_high:
+            # Step 4: Check the point's radial distance against the interpolated radius
+            return r_point <= polycone_radius(z, r_low, r_high, z_low, z_high)
+
+    return False  # Point is outside
+
+
+@njit(cache=True, nogil=True)
+def deadlayer_mask(x, y, z, vol, geometry_arrays, output):
+    # Containment test for flat hit arrays. For meshes with non-decreasing z
+    # the segment is found by binary search, other meshes fall back to the
+    # linear scan of is_point_inside_polycone. Only volumes with an ID above
+    # 1000000 are checked, hits in other volumes are marked as outside.
+    vol_ids, centers, mesh_offsets, r_dl, z_dl, z_min, z_max, z_sorted = geometry_arrays
+    for h in range(len(x)):
+        output[h] = False
+        if vol[h] <= 1000000:
+            continue
+        i = np.searchsorted(vol_ids, vol[h])
+        start, stop = mesh_offsets[i], mesh_offsets[i + 1]
+        x_local = x[h] - centers[i, 0]
+        y_local = y[h] - centers[i, 1]
+        z_local = z[h] - centers[i, 2]
+        if not (z_min[i] <= z_local <= z_max[i]) or stop - start < 2:
+            continue
+        if not z_sorted[i]:
+            output[h] = is_point_inside_polycone(
+                x_local, y_local, z_local, r_dl[start:stop], z_dl[start:stop]
+            )
+            continue
+        # First segment whose upper edge reaches z_local.
+        k = start + max(np.searchsorted(z_dl[start:stop], z_local) - 1, 0)
+        output[h] = np.sqrt(x_local**2 + y_local**2) <= polycone_radius(
+            z_local, r_dl[k], r_dl[k + 1], z_dl[k], z_dl[k + 1]
+        )
+
+
+SIGNATURES = {
+    create_windows: [(float_array, int_array, types.float64)],
+    assign_windows: [(float_array, int_array, float_array, int_array)],
+    group_by_window: [(int_array, int_array, int_array, types.boolean)],
+    r90_per_detector: [(float_array, float_array, float_array, float_array, int_array)],
+    coincident_sums: [
+        (
+            float_array,
+            int_array,
+            float_array,
+            int_array,
+            float_array,
+            int_array,
+            types.float64,
+            types.float64,
+            types.int64,
+            types.int64,
+        )
+    ],
+    cylinder_mask: [
+        (
+            float_array,
+            float_array,
+            float_array,
+            types.float64,
+            types.float64,
+            types.float64,
+            types.boolean,
+            bool_array,
+        )
+    ],
+    deadlayer_mask: [
+        (float_array, float_array, float_array, int_array, geometry_arrays, bool_array)
+    ],
+}
+
+MODULE_KERNELS = {
+    "window": (create_windows, assign_windows, group_by_window),
+    "r90_estimator": (r90_per_detector,),
+    "coincidence_window": (coincident_sums,),
+    "active_volume": (cylinder_mask, deadlayer_mask),
+}
+
+
+def warmup(module_names):
+    """
+    Compile (or load from the on-disk cache) the kernels used by the given
+    pipeline modules. Returns the time spent in seconds.
+    """
+    start = time.perf_counter()
+    kernels = dict.fromkeys(
+        kernel for name in module_names for kernel in MODULE_KERNELS.get(name, ())
+    )
+    for kernel in kernels:
+        for signature in SIGNATURES[kernel]:
+            kernel.compile(signature)
+    return time.perf_counter() - start
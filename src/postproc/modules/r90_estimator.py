@@ -1,51 +1,24 @@
 from __future__ import annotations
 
-import awkward as ak
 import numpy as np
 
-
-def get_R90_per_detector(v_dist, v_edep):
-    tot_e = np.sum(v_edep)
-    mask_sort = v_dist.argsort()
-    v_dist_sort = v_dist[mask_sort]
-    v_edep_sort = v_edep[mask_sort]
-    v_cumsum_edep_sort = np.cumsum(v_edep_sort)
-    if len(v_cumsum_edep_sort):
-        pos = np.argmax(v_cumsum_edep_sort >= 0.9 * tot_e)
-        return v_dist_sort[pos]
-    return 0
+from .jagged import counts_to_offsets, flatten_jagged, unflatten_jagged
+from .kernels import r90_per_detector
 
 
 def calculate_R90(v_edep_hwd, v_posx_hwd, v_posy_hwd, v_posz_hwd):
-    v_posx_edep = v_edep_hwd * v_posx_hwd
-    v_posy_edep = v_edep_hwd * v_posy_hwd
-    v_posz_edep = v_edep_hwd * v_posz_hwd
-    v_edep_e = ak.sum(v_edep_hwd, axis=3)
-
-    v_meanx = ak.sum(v_posx_edep, axis=3) / v_edep_e
-    v_meany = ak.sum(v_posy_edep, axis=3) / v_edep_e
-    v_meanz = ak.sum(v_posz_edep, axis=3) / v_edep_e
-
-    v_dist = np.sqrt(
-        (v_posx_hwd - v_meanx) ** 2
-        + (v_posy_hwd - v_meany) ** 2
-        + (v_posz_hwd - v_meanz) ** 2
-    )
-
-    return ak.Array(
-        [
-            [
-                [
-                    get_R90_per_detector(
-                        v_dist[i, j, k].to_numpy(), v_edep_hwd[i, j, k].to_numpy()
-                    )
-                    for k in range(len(v_dist[i][j]))
-                ]
-                for j in range(len(v_dist[i]))
-            ]
-            for i in range(len(v_dist))
-        ]
+    edep, counts = flatten_jagged(v_edep_hwd)
+    x, _ = flatten_jagged(v_posx_hwd)
+    y, _ = flatten_jagged(v_posy_hwd)
+    z, _ = flatten_jagged(v_posz_hwd)
+    r90 = r90_per_detector(
+        np.ascontiguousarray(edep, dtype=np.float64),
+        np.ascontiguousarray(x, dtype=np.float64),
+        np.ascontiguousarray(y, dtype=np.float64),
+        np.ascontiguousarray(z, dtype=np.float64),
+        counts_to_offsets(counts[-1]),
     )
+    return unflatten_jagged(r90, counts[:-1])
 
 
 def m_r90_estimator(para, input, output, pv):  # noqa: ARG001
@@ -62,7 +35,7 @@ def m_r90_estimator(para, input, output, pv):  # noqa: ARG001
         - posz: Name of z positions array.
 
     output (list): List of output parameters in the following order:
-        - r90: R90 estimation.
+        - r90: R90 estimation, 0 for detectors without hits or without deposited energy.
 
     pv (dict): Dictionary to store the processed values.
 
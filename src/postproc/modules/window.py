@@ -1,79 +1,56 @@
 from __future__ import annotations
 
 import awkward as ak
-from numba import njit
+import numpy as np
+
+from .jagged import counts_to_offsets, flatten_jagged
+from .kernels import assign_windows, create_windows, group_by_window
 
 
 def subtract_smallest_time(t_sv, t_all):
-    return t_sv - ak.min(t_all, axis=1)
+    # Events without hits have no minimum and keep their (empty) list.
+    return t_sv - ak.fill_none(ak.min(t_all, axis=1), 0)
 
 
 def define_windows(t_sub, dT=1e4):
-    t_sub_sort = ak.sort(t_sub, axis=1)
-
-    @njit
-    def create_windows(vec, wdl):
-        output = []
-        for x in vec:
-            tmp_list = [0]
-            for y in x:
-                if y > tmp_list[-1] + wdl:
-                    tmp_list.append(y)
-            output.append(tmp_list)
-        return output
-
-    return ak.Array(create_windows(t_sub_sort, dT))
+    t, (t_counts,) = flatten_jagged(t_sub)
+    w, counts = create_windows(
+        np.ascontiguousarray(t, dtype=np.float64),
+        counts_to_offsets(t_counts),
+        float(dT),
+    )
+    return ak.unflatten(w, counts)
 
 
 def generate_map(t_sub, w_t):
-    @njit
-    def _internal(t_sub, w_t):
-        output = []
-        for i in range(len(t_sub)):
-            tmp_list = []
-            for k in range(len(t_sub[i])):
-                for j in range(len(w_t[i]) - 1):
-                    if t_sub[i][k] >= w_t[i][j] and t_sub[i][k] < w_t[i][j + 1]:
-                        tmp_list.append(j)
-            output.append(tmp_list)
-        return output
-
-    return ak.Array(_internal(t_sub, w_t))
-
-
-@njit
-def generate_windowed_hit_list(mapping, v_in, index):
-    output = []
-    for i in range(len(mapping)):
-        if mapping[i] == index:
-            output.append(v_in[i])
-    if len(output) == 0:
-        output.append(0)
-    return output
-
-
-@njit
-def generate_all_windowed_hit_lists(mapping, v_in):
-    list_in_indices = []
-    output = []
-    for i in range(len(mapping)):
-        if mapping[i] not in list_in_indices:
-            list_in_indices.append(mapping[i])
-    for i in range(len(list_in_indices)):
-        output.append(generate_windowed_hit_list(mapping, v_in, i))
-
-    return output
-
-
-def generate_all_windowed_hits_for_all_events(mapping, v_in):
-    @njit
-    def _internal(mapping, v_in):
-        output = []
-        for i in range(len(v_in)):
-            output.append(generate_all_windowed_hit_lists(mapping[i], v_in[i]))
-        return output
-
-    return ak.Array(_internal(mapping, v_in))
+    t, (t_counts,) = flatten_jagged(t_sub)
+    w, (w_counts,) = flatten_jagged(w_t)
+    mapping, counts = assign_windows(
+        np.ascontiguousarray(t, dtype=np.float64),
+        counts_to_offsets(t_counts),
+        np.ascontiguousarray(w, dtype=np.float64),
+        counts_to_offsets(w_counts),
+    )
+    return ak.unflatten(mapping, counts)
+
+
+def generate_window_grouping(mapping, v_in, pad_empty=True):
+    m, (m_counts,) = flatten_jagged(mapping)
+    _, (v_counts,) = flatten_jagged(v_in)
+    return group_by_window(
+        np.ascontiguousarray(m, dtype=np.int64),
+        counts_to_offsets(m_counts),
+        counts_to_offsets(v_counts),
+        bool(pad_empty),
+    )
+
+
+def apply_window_grouping(grouping, v_in):
+    perm, window_counts, event_counts = grouping
+    content = ak.to_numpy(ak.flatten(v_in, axis=None))
+    windowed = content[np.maximum(perm, 0)]
+    windowed[perm < 0] = 0
+    return ak.unflatten(ak.unflatten(windowed, window_counts), event_counts)
 
 
 def m_window(para, input, output, pv):
@@ -83,6 +60,7 @@ def m_window(para, input, output, pv):
     Parameters:
     para (dict): Dictionary containing parameters for the windowing module.
         - dT (float): Time window duration.
+        - pad_empty_windows (bool, optional): Fill empty windows with a single 0 entry. Defaults to True.
 
     input (list): List of input parameters in the following order:
         - t_all: Name of all times array.
@@ -129,9 +107,10 @@ def m_window(para, input, output, pv):
     t_sub = subtract_smallest_time(pv[in_n["t"]], pv[in_n["t_all"]])
     w_t = define_windows(t_sub, para["dT"])
     map = generate_map(t_sub, w_t)
+    grouping = generate_window_grouping(map, t_sub, para.get("pad_empty_windows", True))
 
-    pv[out_n["t_sub"]] = generate_all_windowed_hits_for_all_events(map, t_sub)  # t_sub
+    pv[out_n["t_sub"]] = apply_window_grouping(grouping, t_sub)
     pv[out_n["w_t"]] = w_t
 
     for key in list(out_n.keys())[2:]:
-        pv[out_n[key]] = generate_all_windowed_hits_for_all_events(map, pv[in_n[key]])
+        pv[out_n[key]] = apply_window_grouping(grouping, pv[in_n[key]])
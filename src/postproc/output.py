@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from functools import partial
+from importlib import import_module
+
+# Output formats: writer module (which defines a writer class of the same name
+# and storage_options(inst)) and file suffix.
+FORMATS = {
+    "hdf5": ("h5_writer", ".hdf5"),
+    "parquet": ("parquet_writer", ".parquet"),
+}
+
+
+def output_options(inst):
+    """
+    Path and format of the output.
+
+    inst["io"]["output"] is either a path (HDF5 output) or a dict
+    {"path": ..., "format": "hdf5" | "parquet"}.
+    """
+    output = inst["io"]["output"]
+    if not isinstance(output, dict):
+        return output, "hdf5"
+    output_format = output.get("format", "hdf5")
+    if output_format not in FORMATS:
+        error_message = (
+            f"Unsupported output format {output_format!r}, use one of {list(FORMATS)}."
+        )
+        raise ValueError(error_message)
+    return output["path"], output_format
+
+
+def output_suffix(inst):
+    return FORMATS[output_options(inst)[1]][1]
+
+
+def output_writer(inst):
+    """Writer class of the output format, bound to the storage options."""
+    output_format = output_options(inst)[1]
+    name = FORMATS[output_format][0]
+    try:
+        module = import_module(name)
+    except ImportError as e:
+        error_message = (
+            f"The {output_format} output requires {e.name}, "
+            f"install it with pip install postproc[{output_format}]."
+        )
+        raise ImportError(error_message) from e
+    return partial(getattr(module, name), **module.storage_options(inst))
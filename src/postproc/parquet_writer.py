@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import awkward as ak
+import pyarrow.parquet as pq
+from h5_writer import merge_unknown
+
+COMPRESSIONS = (None, "snappy", "gzip", "brotli", "lz4", "zstd")
+
+
+def storage_options(inst):
+    """
+    Writer options of Parquet outputs from the "storage" entry of inst["io"].
+
+    Keys: "compression" (one of COMPRESSIONS), "compression_opts" (codec
+    level) and "chunk_events" (maximum events per row group).
+    """
+    storage = dict(inst["io"].get("storage", {}))
+    unknown = set(storage) - {"compression", "compression_opts", "chunk_events"}
+    if unknown:
+        error_message = f"Unknown storage options {sorted(unknown)} for Parquet output."
+        raise ValueError(error_message)
+    if storage.get("compression") not in COMPRESSIONS:
+        error_message = (
+            f"Unsupported compression {storage['compression']!r}, "
+            f"use one of {COMPRESSIONS[1:]}."
+        )
+        raise ValueError(error_message)
+    return storage
+
+
+class parquet_writer:
+    """
+    Streaming writer for awkward arrays to a Parquet file.
+
+    Every call to write() appends one batch (step_size events) as a row
+    group, split further if it has more than chunk_events events. Fields are
+    stored as separate columns, so they can be read on their own, e.g. with
+    ak.from_parquet(file, columns=[...], row_groups=[...]).
+
+    The schema of the file is fixed when the first row group is written.
+    Batches with unknown types (e.g. lists that are empty in every event)
+    are therefore held back until later batches determine those types, and
+    converted to them.
+    """
+
+    def __init__(
+        self, outfile, compression=None, compression_opts=None, chunk_events=None
+    ):
+        self.outfile = outfile
+        self.writer = None
+        self.form = None
+        self.type = None
+        self.length = 0
+        self.compression = compression or "none"
+        self.compression_level = compression_opts
+        self.row_group_size = chunk_events
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, array):
+        array = ak.to_packed(array)
+        if self.type is None:
+            form = array.layout.form
+            self.form = form if self.form is None else merge_unknown(self.form, form)
+            self._pending.append(array)
+            if not _has_unknown(self.form):
+                self._write_pending()
+            return
+        self._write_array(array)
+
+    def _write_pending(self):
+        self.type = self.form.type
+        pending, self._pending = self._pending, []
+        for array in pending:
+            self._write_array(array)
+
+    def _write_array(self, array):
+        if array.type.content != self.type:
+            # Batches can differ in inferred types (e.g. all-empty lists).
+            array = ak.enforce_type(array, self.type)
+        self.write_table(ak.to_arrow_table(array, extensionarray=False))
+
+    def write_table(self, table):
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(
+                self.outfile,
+                table.schema,
+                compression=self.compression,
+                compression_level=self.compression_level,
+            )
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.length += len(table)
+
+    def write_file(self, file, step_size=None):  # noqa: ARG002
+        """Append the row groups of another postproc Parquet output."""
+        source = pq.ParquetFile(file)
+        for i in range(source.num_row_groups):
+            table = source.read_row_group(i)
+            if self.writer is not None and table.schema.equals(self.writer.schema):
+                self.write_table(table)
+            else:
+                self.write(ak.from_arrow(table))
+
+    def close(self):
+        if self._pending:
+            # Types that stayed unknown in all batches are written as such.
+            self._write_pending()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def _has_unknown(form):
+    if isinstance(form, ak.forms.EmptyForm):
+        return True
+    if isinstance(form, ak.forms.RecordForm):
+        return any(_has_unknown(content) for content in form.contents)
+    return hasattr(form, "content") and _has_unknown(form.content)
@@ -6,15 +6,36 @@ from module_manager import module_manager
 
 
 def run_post_proc(args):
-    try:
-        infile = args[0]
-        outfile = args[1]
-        inst = args[2]
-        task_id = args[3]
+    jobs = args[0]
+    inst = args[1]
+    task_id = args[2]
 
-        pm = module_manager(inst)
-        dm = data_manager(inst, infile, outfile, pm, task_id)
-        dm.process_data()
-        dm.write_output()
-    except uproot.exceptions.KeyInFileError:
-        pass
+    # The module chain (and its compiled kernels) is shared by all jobs of
+    # the task.
+    pm = module_manager(inst)
+    jit_time = pm.warmup() if inst["para"].get("warmup", False) else 0.0
+    processed = []
+    io = []
+    for infile, outfile, entry_start, entry_stop in jobs:
+        dm = None
+        try:
+            dm = data_manager(
+                inst, infile, outfile, pm, task_id, entry_start, entry_stop
+            )
+            dm.process_data()
+            dm.write_output()
+        except BaseException as e:
+            if dm is not None:
+                dm.discard_output()
+            if isinstance(e, uproot.exceptions.KeyInFileError):
+                continue
+            raise
+        processed.append(str(infile))
+        if dm.io_report is not None:
+            io.append(dm.io_report)
+    return {
+        "infiles": processed,
+        "jit_time": jit_time,
+        "io": io,
+        "telemetry": pm.telemetry.events,
+    }
@@ -1,78 +1,219 @@
 from __future__ import annotations
 
-import tempfile
+import os
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
-import awkward as ak
-import h5py
-import numpy as np
+import uproot
+from h5_reader import output_reader
+from manifest import manifest
+from output import output_options, output_suffix, output_writer
 from process import run_post_proc
+from telemetry import export_telemetry, format_summary
+from tqdm import tqdm
 
 
 class process_manager:
     def __init__(self, inst, overwrite=False):
         self.in_folder = inst["io"]["input"]["folder"]
         self.in_format = inst["io"]["input"]["format"]
-        self.out = inst["io"]["output"]
+        self.out, self.out_format = output_options(inst)
+        self.writer = output_writer(inst)
+        suffix = output_suffix(inst)
         self.overwrite = overwrite
         self.threads = inst["para"]["threads"]
+        self.step_size = inst["para"].get("step_size")
         self.mode = inst["para"].get("mode", "")
+        self.summarize_layout = inst["para"].get("summarize_layout", "stream")
+        if self.summarize_layout == "virtual" and self.out_format != "hdf5":
+            error_message = "summarize_layout virtual requires the hdf5 output format."
+            raise ValueError(error_message)
+        self.warmup = inst["para"].get("warmup", False)
+        # para "telemetry": true, or {"summary": <json file>, "trace": <json file>}
+        self.telemetry = inst["para"].get("telemetry", False)
+        self.entries_per_task = inst["para"].get("entries_per_task")
+        self.tree = inst["input"].get("tree")
+
+        # Parse dead-layer geometries once in the main process. Forked workers
+        # inherit the in-memory cache, others load the binary cache file if
+        # the geometry cache is enabled.
+        for p_inst in inst["instr"]:
+            para = {**p_inst.get("para", {}), **inst["para"]}
+            if p_inst["module"] == "active_volume" and para.get("type") == "deadlayer":
+                from modules.active_volume import (  # noqa: PLC0415
+                    load_deadlayer_geometry,
+                )
+
+                load_deadlayer_geometry(para["file"], para.get("geometry_cache"))
 
         # Get input files and corresponding output files
-        self.input_files = list(Path(self.in_folder).glob("*." + self.in_format))[:2]
+        self.input_files = sorted(Path(self.in_folder).glob("*." + self.in_format))
         if self.mode != "summarize":
-            self.output_files = [
-                Path(self.out).joinpath(infile.stem + ".hdf5")
-                for infile in self.input_files
-            ]
+            out_dir = Path(self.out)
         else:
-            self.tmp_dir = tempfile.mkdtemp()
-            self.output_files = [
-                Path(self.tmp_dir).joinpath(infile.stem + ".hdf5")
-                for infile in self.input_files
-            ]
-            # self.output_files = self.out
+            # The per-file outputs of the summary are kept in a directory next
+            # to it, so that reruns only reprocess what changed.
+            out_dir = Path(self.out).with_name(Path(self.out).stem + ".parts")
+            out_dir.mkdir(parents=True, exist_ok=True)
+        self.output_files = [
+            out_dir.joinpath(infile.stem + suffix) for infile in self.input_files
+        ]
+        self.summary_files = list(self.output_files)
 
-        # Filter out files that already exist if overwrite is False
+        # Only outputs that are missing or stale (changed input, instructions
+        # or package version) are processed, unless overwrite is True.
+        self.manifest = manifest(out_dir.joinpath("postproc_manifest.json"), inst)
         if not self.overwrite:
-            mask_doesnt_exist = np.array(
-                [not Path.exists(f) for f in self.output_files]
-            )
-            self.input_files = np.array(self.input_files)[mask_doesnt_exist].tolist()
-            self.output_files = np.array(self.output_files)[mask_doesnt_exist].tolist()
-
-        # Create a list of arguments: each is a tuple (input_file, output_file, inst)
-        self.args = list(
-            zip(
-                self.input_files,
-                self.output_files,
-                [inst] * len(self.input_files),
-                np.arange(len(self.input_files)),
+            stale = [
+                not self.manifest.is_current(infile, outfile)
+                for infile, outfile in zip(self.input_files, self.output_files)
+            ]
+            self.input_files = [f for f, s in zip(self.input_files, stale) if s]
+            self.output_files = [f for f, s in zip(self.output_files, stale) if s]
+
+        # Jobs are tuples (input_file, output_file, entry_start, entry_stop, cost).
+        # Large ROOT inputs are split into entry ranges, each processed into a
+        # partial output that is merged into the output file afterwards.
+        self.partial_files = {}
+        jobs = []
+        for infile, outfile in zip(self.input_files, self.output_files):
+            size = Path(infile).stat().st_size
+            ranges = self.entry_ranges(infile)
+            if len(ranges) == 1:
+                jobs.append((infile, outfile, *ranges[0], size))
+                continue
+            n_entries = ranges[-1][1]
+            parts = [
+                Path(outfile).with_name(f"{Path(outfile).stem}.part{i:04d}{suffix}")
+                for i in range(len(ranges))
+            ]
+            self.partial_files[outfile] = parts
+            jobs.extend(
+                (infile, part, start, stop, size * (stop - start) / n_entries)
+                for part, (start, stop) in zip(parts, ranges)
             )
-        )
+
+        # Create a list of arguments: each is a tuple (jobs, inst, task_id)
+        tasks = self.schedule(jobs, inst["para"].get("min_task_size"))
+        self.args = [(task, inst, task_id) for task_id, task in enumerate(tasks)]
+
+    def schedule(self, jobs, min_task_size=None):
+        """
+        Group jobs into tasks, the most expensive task first.
+
+        The cost of a job is the size of its input file (its share for entry
+        ranges). Jobs cheaper than min_task_size (in bytes, by default a
+        quarter of the average work per worker) are packed into common tasks
+        of about that cost, so many small files do not each pay the per-task
+        overhead. Tasks are submitted in order of decreasing cost (longest
+        processing time first), which avoids a long tail of large files.
+        """
+        if min_task_size is None:
+            min_task_size = sum(job[-1] for job in jobs) / (4 * max(self.threads, 1))
+        jobs = sorted(jobs, key=lambda job: job[-1], reverse=True)
+        tasks = [[job] for job in jobs if job[-1] >= min_task_size]
+        packed = []
+        packed_cost = 0
+        for job in jobs:
+            if job[-1] >= min_task_size:
+                continue
+            packed.append(job)
+            packed_cost += job[-1]
+            if packed_cost >= min_task_size:
+                tasks.append(packed)
+                packed = []
+                packed_cost = 0
+        if packed:
+            tasks.append(packed)
+        tasks.sort(key=lambda task: sum(job[-1] for job in task), reverse=True)
+        return [[job[:4] for job in task] for task in tasks]
+
+    def entry_ranges(self, infile):
+        if self.in_format != "root" or not self.entries_per_task:
+            return [(None, None)]
+        try:
+            with uproot.open(infile) as f:
+                n_entries = f[self.tree].num_entries
+        except uproot.exceptions.KeyInFileError:
+            return [(None, None)]
+        step = self.entries_per_task
+        ranges = [
+            (start, min(start + step, n_entries)) for start in range(0, n_entries, step)
+        ]
+        return ranges or [(None, None)]
+
+    def merge_partial_files(self):
+        # Partial outputs are appended in entry order, so every event keeps its
+        # position (and event ID) from the input file. If any entry range
+        # failed, the output is incomplete: it is not merged (an output of an
+        # earlier run is removed) and its input is processed again next run.
+        self.incomplete = set()
+        for outfile, parts in self.partial_files.items():
+            missing = [part for part in parts if not Path(part).exists()]
+            if missing:
+                self.incomplete.add(outfile)
+                tqdm.write(
+                    f"Skipping {outfile}: {len(missing)} of {len(parts)} "
+                    "partial outputs are missing."
+                )
+                for path in [*parts, outfile]:
+                    Path(path).unlink(missing_ok=True)
+                continue
+            with self.writer(outfile) as writer:
+                for part in parts:
+                    writer.write_file(part, self.step_size)
+            for part in parts:
+                Path(part).unlink()
 
     def summarize(self):
-        def gen_files():
-            for file in self.output_files:
-                with h5py.File(file, "r") as f:
-                    group = f["awkward"]
-                    reconstituted = ak.from_buffers(
-                        ak.forms.from_json(group.attrs["form"]),
-                        group.attrs["length"],
-                        {k: np.asarray(v) for k, v in group.items()},
-                    )
-                    yield ak.Array(reconstituted)
-
-        with h5py.File(self.out, "w") as f:
-            group = f.create_group("awkward")
-            form, length, container = ak.to_buffers(
-                ak.to_packed(ak.concatenate(ak.from_iter(gen_files()))), container=group
-            )
-            group.attrs["form"] = form.to_json()
-            group.attrs["length"] = length
+        """
+        Combine the per-file outputs into the single output file.
+
+        The per-file outputs are read with output_reader and appended in
+        chunks of step_size events, so memory use does not grow with the file
+        size (Parquet outputs are appended row group by row group). With para
+        "summarize_layout": "virtual", data buffers are not copied but mapped
+        as HDF5 virtual datasets onto the per-file outputs. Per-file outputs
+        are kept in <output>.parts in both layouts.
+
+        The summary is written to a temporary file next to the output, which
+        replaces the output once it is complete.
+        """
+        files = [file for file in self.summary_files if Path(file).exists()]
+        options = {"virtual": True} if self.summarize_layout == "virtual" else {}
+        out = Path(self.out)
+        tmp_out = out.with_suffix(f".{os.getpid()}.tmp{out.suffix}")
+        try:
+            with self.writer(tmp_out, **options) as writer:
+                self._write_summary(writer, files, streamed=not options)
+            tmp_out.replace(out)
+        finally:
+            tmp_out.unlink(missing_ok=True)
+
+    def _write_summary(self, writer, files, streamed):
+        if self.out_format != "hdf5" or not streamed or not files:
+            for file in files:
+                writer.write_file(file, self.step_size)
+            return
+        with output_reader(files) as reader:
+            # Without step_size every file is appended at once.
+            step_size = self.step_size or max(len(reader), 1)
+            for chunk in reader.iterate(step_size):
+                writer.write(chunk)
+
+    def update_manifest(self):
+        processed = set()
+        for r in self.report:
+            processed.update(r["infiles"])
+        for infile, outfile in zip(self.input_files, self.output_files):
+            if outfile in self.incomplete:
+                continue
+            if str(infile) in processed and Path(outfile).exists():
+                self.manifest.record(infile, outfile)
+        self.manifest.save()
 
     def run_processes(self):
+        self.report = []
         if self.threads > 1:
             # Use multiprocessing to run run_post_proc with the arguments
             with ProcessPoolExecutor(max_workers=self.threads) as executor:
@@ -81,11 +222,57 @@ class process_manager:
                 # iterate over all submitted tasks and get results as they are available
                 for future in as_completed(futures):
                     # get the result for the next completed task
-                    future.result()  # blocks
+                    self.report.append(future.result())  # blocks
             # results = executor.map(lambda args: run_post_proc(*args), self.args)
         else:
             for i in range(len(self.args)):
-                run_post_proc(self.args[i])
+                self.report.append(run_post_proc(self.args[i]))
+        if self.report and self.warmup:
+            jit_time = sum(r["jit_time"] for r in self.report)
+            tqdm.write(f"JIT warm-up: {jit_time:.2f} s in {len(self.report)} tasks")
+        # Split inputs appear once per entry range.
+        io = {}
+        for entry in (entry for r in self.report for entry in r["io"]):
+            read, available = io.get(entry["infile"], (0, entry["bytes_available"]))
+            io[entry["infile"]] = (read + entry["bytes_read"], available)
+        for infile, (read, available) in sorted(io.items()):
+            tqdm.write(f"{Path(infile).name}: {format_io(read, available)}")
+        if len(io) > 1:
+            read, available = (sum(values) for values in zip(*io.values()))
+            tqdm.write(f"Input: {format_io(read, available)}")
 
+        if self.telemetry:
+            files = self.telemetry if isinstance(self.telemetry, dict) else {}
+            summary = export_telemetry(
+                [event for r in self.report for event in r["telemetry"]],
+                summary_file=files.get("summary"),
+                trace_file=files.get("trace"),
+            )
+            tqdm.write(format_summary(summary))
+
+        self.merge_partial_files()
+        self.update_manifest()
+
+        # The summary is only rebuilt when its per-file outputs changed.
         if self.mode == "summarize":
-            self.summarize()
+            sources = [Path(f).name for f in self.summary_files if Path(f).exists()]
+            if (
+                self.args
+                or sources != self.manifest.summary
+                or not Path(self.out).exists()
+            ):
+                # Until the new summary is complete, it is not current.
+                self.manifest.summary = None
+                self.manifest.changed = True
+                self.manifest.save()
+                self.summarize()
+                self.manifest.summary = sources
+                self.manifest.changed = True
+                self.manifest.save()
+
+
+def format_io(bytes_read, bytes_available):
+    return (
+        f"read {bytes_read / 1e6:.1f} MB of {bytes_available / 1e6:.1f} MB "
+        f"({100 * bytes_read / max(bytes_available, 1):.0f}%)"
+    )
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import awkward as ak
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process, in MB.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux and in bytes on macOS.
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def counts(array):
+    # Number of events and of innermost entries (hits) of a processed array.
+    if not isinstance(array, ak.Array):
+        return {"events": 1, "hits": 1}
+    if array.ndim == 1:
+        return {"events": len(array), "hits": len(array)}
+    return {"events": len(array), "hits": int(ak.count(array, axis=None))}
+
+
+class telemetry:
+    """
+    Timing spans of one worker, exported as Chrome trace events.
+
+    Every span records its wall and CPU time (of the calling thread), the
+    peak RSS of the worker after the span, and any counters passed in args.
+    When disabled, spans cost a single attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self.pid = os.getpid()
+
+    @contextmanager
+    def span(self, name, category, args=None):
+        if not self.enabled:
+            yield args
+            return
+        args = {} if args is None else args
+        start = time.time()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield args
+        finally:
+            wall = time.perf_counter() - wall
+            args["cpu"] = time.thread_time() - cpu
+            args["peak_rss_mb"] = peak_rss_mb()
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": wall * 1e6,
+                    "pid": self.pid,
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+    def iterate(self, iterable, name, category="io"):
+        """Yield from iterable, recording the time of every step as a span."""
+        iterator = iter(iterable)
+        while True:
+            with self.span(name, category) as args:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    if args is not None:
+                        args["exhausted"] = True
+                    return
+            yield item
+
+    def run_module(self, proc, processing_variables):
+        if not self.enabled:
+            proc.run(processing_variables)
+            return
+        args = {}
+        if proc.input:
+            args.update(
+                {
+                    f"{k}_in": v
+                    for k, v in counts(processing_variables[proc.input[0]]).items()
+                }
+            )
+        with self.span(proc.name, "module", args):
+            proc.run(processing_variables)
+        outputs = [processing_variables[name] for name in proc.output]
+        if outputs:
+            args.update({f"{k}_out": v for k, v in counts(outputs[0]).items()})
+        args["nbytes_out"] = sum(
+            output.nbytes for output in outputs if isinstance(output, ak.Array)
+        )
+
+
+def summarize_events(events):
+    """
+    Aggregate the spans of all workers per category and name.
+
+    Times are summed over calls, counters are summed and peak RSS is the
+    maximum. Workers are listed with their total span time and peak RSS.
+    """
+    summary = {}
+    workers = {}
+    for event in events:
+        if event["args"].get("exhausted"):
+            continue
+        entry = summary.setdefault(event["cat"], {}).setdefault(
+            event["name"], {"calls": 0, "wall": 0.0}
+        )
+        entry["calls"] += 1
+        entry["wall"] += event["dur"] / 1e6
+        for key, value in event["args"].items():
+            if key == "peak_rss_mb":
+                if value is not None:
+                    entry[key] = max(entry.get(key, 0.0), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                entry[key] = entry.get(key, 0) + value
+        worker = workers.setdefault(str(event["pid"]), {"wall": 0.0})
+        if event["cat"] != "batch":
+            worker["wall"] += event["dur"] / 1e6
+        if event["args"].get("peak_rss_mb") is not None:
+            worker["peak_rss_mb"] = max(
+                worker.get("peak_rss_mb", 0.0), event["args"]["peak_rss_mb"]
+            )
+    summary["workers"] = workers
+    return summary
+
+
+def format_summary(summary):
+    # Table of the modules and I/O steps, the most expensive first.
+    lines = [
+        f"{'step':>24} {'calls':>6} {'wall [s]':>9} {'cpu [s]':>8} {'hits in':>10}"
+    ]
+    steps = [
+        (name, entry)
+        for category in ("module", "io", "jit")
+        for name, entry in summary.get(category, {}).items()
+    ]
+    for name, entry in sorted(steps, key=lambda step: -step[1]["wall"]):
+        lines.append(
+            f"{name:>24} {entry['calls']:>6} {entry['wall']:>9.3f} "
+            f"{entry.get('cpu', 0.0):>8.3f} {entry.get('hits_in', ''):>10}"
+        )
+    return "\n".join(lines)
+
+
+def export_telemetry(events, summary_file=None, trace_file=None):
+    """
+    Write the aggregated JSON summary and/or the Chrome trace of events.
+
+    Returns the summary. The trace can be opened in chrome://tracing or
+    https://ui.perfetto.dev.
+    """
+    summary = summarize_events(events)
+    if summary_file:
+        with Path(summary_file).open("w") as f:
+            json.dump(summary, f, indent=2)
+    if trace_file:
+        with Path(trace_file).open("w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return summary
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+import pytest
+import uproot
+
+# The pipeline uses flat imports and runs from src/postproc.
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src" / "postproc"))
+
+
+def write_root_input(file, n_events, seed=0):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, 5, n_events)
+    n_hits = int(counts.sum())
+
+    def jagged(values):
+        return ak.unflatten(values, counts)
+
+    with uproot.recreate(file) as f:
+        f["hit"] = {
+            "t": jagged(rng.uniform(0, 1e5, n_hits)),
+            "edep": jagged(rng.uniform(0, 100, n_hits)),
+            "vol": jagged(rng.integers(1010000, 1010003, n_hits).astype(np.int32)),
+            "x": jagged(rng.normal(size=n_hits)),
+            "y": jagged(rng.normal(size=n_hits)),
+            "z": jagged(rng.normal(size=n_hits)),
+        }
+
+
+@pytest.fixture
+def inst(tmp_path):
+    """Instructions of a small pipeline over two ROOT inputs in tmp_path/in."""
+    (tmp_path / "in").mkdir()
+    (tmp_path / "out").mkdir()
+    write_root_input(tmp_path / "in" / "sim_0.root", 60, seed=0)
+    write_root_input(tmp_path / "in" / "sim_1.root", 40, seed=1)
+    hits = ["t", "edep", "vol", "x", "y", "z"]
+    return {
+        "io": {
+            "input": {"folder": str(tmp_path / "in"), "format": "root"},
+            "output": str(tmp_path / "out"),
+        },
+        "input": {"tree": "hit", "var": {name: f"hit/{name}" for name in hits}},
+        "para": {"threads": 1, "step_size": 25},
+        "instr": [
+            {
+                "name": "window",
+                "module": "window",
+                "input": ["t", *hits],
+                "output": ["w_t", "t_sub", "w_edep", "w_vol", "w_x", "w_y", "w_z"],
+                "para": {"dT": 1e4},
+            },
+            {
+                "name": "sum",
+                "module": "sum_energy",
+                "input": ["w_edep"],
+                "output": ["Ew"],
+            },
+        ],
+        "output": ["w_t", "t_sub", "Ew"],
+    }
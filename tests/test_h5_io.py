@@ -0,0 +1,167 @@
+"""
+Round trips through the appending HDF5 writer and the readers.
+"""
+
+from __future__ import annotations
+
+import awkward as ak
+import h5py
+import numpy as np
+import pytest
+from h5_reader import h5_reader, output_reader
+from h5_writer import h5_writer
+
+BATCHES = [
+    [
+        {"x": [[1.0, 2.0], []], "y": 1.0, "m": 1},
+        {"x": [[3.0]], "y": 2.0, "m": None},
+    ],
+    [
+        {"x": [], "y": 3.0, "m": None},
+        {"x": [[4.0], [5.0, 6.0]], "y": 4.0, "m": 2},
+        {"x": [[7.0]], "y": 5.0, "m": 3},
+    ],
+]
+
+
+def write(path, batches, **options):
+    with h5_writer(path, **options) as writer:
+        for batch in batches:
+            writer.write(batch)
+
+
+def read(path, **options):
+    with h5_reader(path, **options) as reader:
+        return reader.read().to_list()
+
+
+def jagged_batches():
+    # Records with nested lists and an option field (IndexedOptionForm), the
+    # second batch being empty.
+    first, last = (ak.Array(batch) for batch in BATCHES)
+    return [first, first[:0], last]
+
+
+def test_write_jagged(tmp_path):
+    batches = jagged_batches()
+    write(tmp_path / "out.hdf5", batches, chunk_events=2)
+    expected = ak.concatenate(batches)
+    assert read(tmp_path / "out.hdf5") == expected.to_list()
+    with h5_reader(tmp_path / "out.hdf5") as reader:
+        assert reader.form.type == expected.type.content
+        # Offsets and indices are rebased on the entries already written.
+        chunks = [chunk.to_list() for chunk in reader.iterate(2)]
+    assert [entry for chunk in chunks for entry in chunk] == expected.to_list()
+    assert chunks[1] == expected[2:4].to_list()
+
+
+def test_write_bytemasked(tmp_path):
+    array = ak.Array(
+        ak.contents.ByteMaskedArray(
+            ak.index.Index8(np.array([1, 0, 1], dtype=np.int8)),
+            ak.contents.NumpyArray(np.array([1.0, 2.0, 3.0])),
+            valid_when=True,
+        )
+    )
+    write(tmp_path / "out.hdf5", [array, array[:0], array[1:]])
+    assert read(tmp_path / "out.hdf5") == [1.0, None, 3.0, None, 3.0]
+
+
+def test_write_unknown_first_batch(tmp_path):
+    batches = [
+        ak.Array({"x": [[], []], "y": [1.0, 2.0]}),
+        ak.Array({"x": [[1.0], [2.0, 3.0]], "y": [3.0, 4.0]}),
+    ]
+    write(tmp_path / "out.hdf5", batches, chunk_events=10)
+    assert read(tmp_path / "out.hdf5") == ak.concatenate(batches).to_list()
+    with h5py.File(tmp_path / "out.hdf5") as f:
+        # The chunks follow the first batch with data, not the empty lists.
+        assert f["awkward/node2-data"].chunks == (15,)
+
+
+def test_write_mismatch(tmp_path):
+    writer = h5_writer(tmp_path / "out.hdf5")
+    writer.write(ak.Array({"x": [1.0]}))
+    with pytest.raises(ValueError, match="does not match"):
+        writer.write(ak.Array({"z": [1]}))
+    writer.close()
+
+
+def test_write_fields(tmp_path):
+    write(tmp_path / "out.hdf5", jagged_batches())
+    assert read(tmp_path / "out.hdf5", fields=["y", "m"]) == [
+        {"y": y, "m": m}
+        for y, m in [(1.0, 1), (2.0, None), (3.0, None), (4.0, 2), (5.0, 3)]
+    ]
+
+
+@pytest.mark.parametrize("virtual", [False, True])
+def test_write_file(tmp_path, virtual):
+    parts = []
+    for i, batch in enumerate(jagged_batches()):
+        parts.append(tmp_path / f"part_{i}.hdf5")
+        write(parts[-1], [batch])
+    with h5_writer(tmp_path / "out.hdf5", virtual=virtual) as writer:
+        for part in parts:
+            writer.write_file(part, step_size=2)
+    assert read(tmp_path / "out.hdf5") == ak.concatenate(jagged_batches()).to_list()
+    with h5py.File(tmp_path / "out.hdf5") as f:
+        assert f["awkward/node3-data"].is_virtual == virtual
+
+
+def test_write_file_virtual_empty(tmp_path):
+    # x is empty in every source, so its data buffer has nothing to map.
+    parts = [tmp_path / "part_0.hdf5", tmp_path / "part_1.hdf5"]
+    write(parts[0], [ak.Array({"x": [[1.0]], "y": [1.0]})[:0]])
+    write(parts[1], [ak.Array({"x": [[], []], "y": [2.0, 3.0]})])
+    with h5_writer(tmp_path / "out.hdf5", virtual=True) as writer:
+        for part in parts:
+            writer.write_file(part)
+    assert read(tmp_path / "out.hdf5") == [{"x": [], "y": 2.0}, {"x": [], "y": 3.0}]
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    # Per-file outputs with three, zero and two events.
+    first, empty, last = jagged_batches()
+    write(tmp_path / "a.hdf5", [first, last[:1]])
+    write(tmp_path / "b.hdf5", [empty])
+    write(tmp_path / "c.hdf5", [last[1:]])
+    return tmp_path, ak.concatenate(jagged_batches())
+
+
+def test_output_reader_array(outputs):
+    path, expected = outputs
+    with output_reader(path) as reader:
+        array = reader.array()
+        assert len(reader) == len(expected)
+        # Offsets and indices of later files are shifted on concatenation.
+        assert array.to_list() == expected.to_list()
+    with output_reader([path / "c.hdf5", path / "a.hdf5"], fields=["m"]) as reader:
+        assert reader.array().m.to_list() == [2, 3, 1, None, None]
+
+
+def test_output_reader_iterate(outputs):
+    path, expected = outputs
+    with output_reader(path, fields=["x", "y"]) as reader:
+        chunks = [chunk.to_list() for chunk in reader.iterate(2, 2, 5)]
+    # Chunks end at file boundaries.
+    assert [len(chunk) for chunk in chunks] == [1, 2]
+    assert [entry for chunk in chunks for entry in chunk] == [
+        {"x": entry["x"], "y": entry["y"]} for entry in expected[2:5].to_list()
+    ]
+
+
+def test_output_reader_buffer(outputs):
+    path, _ = outputs
+    with h5_reader(path / "a.hdf5") as reader:
+        assert reader.buffer("node1-offsets", 1).tolist() == [2, 3, 3]
+
+
+def test_output_reader_errors(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        output_reader(tmp_path)
+    write(tmp_path / "a.hdf5", [ak.Array({"x": [1.0]})])
+    write(tmp_path / "b.hdf5", [ak.Array({"x": [1]})])
+    with output_reader(tmp_path) as reader, pytest.raises(ValueError, match="form"):
+        reader.array()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import copy
+import json
+import os
+
+import pytest
+from conftest import write_root_input
+from h5_reader import h5_reader
+from manifest import instruction_hash, manifest
+from process_manager import process_manager
+
+
+@pytest.fixture
+def recorded(inst, tmp_path):
+    infile = tmp_path / "in" / "sim_0.root"
+    outfile = tmp_path / "out" / "sim_0.hdf5"
+    outfile.write_bytes(b"")
+    m = manifest(tmp_path / "out" / "postproc_manifest.json", inst)
+    m.record(infile, outfile)
+    m.save()
+    return m, infile, outfile
+
+
+def touch(file):
+    stat = file.stat()
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_is_current(inst, recorded):
+    m, infile, outfile = recorded
+    assert m.is_current(infile, outfile)
+    assert manifest(m.file, inst).is_current(infile, outfile)
+    outfile.unlink()
+    assert not m.is_current(infile, outfile)
+
+
+def test_is_current_input_changed(recorded):
+    m, infile, outfile = recorded
+    content = infile.read_bytes()
+    infile.write_bytes(content + b"\0")
+    assert not m.is_current(infile, outfile)
+    # Same size, different content.
+    infile.write_bytes(content[:-1] + bytes([content[-1] ^ 1]))
+    assert not m.is_current(infile, outfile)
+
+
+def test_is_current_touched(recorded):
+    m, infile, outfile = recorded
+    # Without a stored checksum, a changed mtime cannot be verified.
+    touch(infile)
+    assert not m.is_current(infile, outfile)
+    # Recording the reprocessed output stores the checksum computed above,
+    # so from then on only touching the input keeps the output current.
+    m.record(infile, outfile)
+    touch(infile)
+    assert m.is_current(infile, outfile)
+    content = infile.read_bytes()
+    infile.write_bytes(content[:-1] + bytes([content[-1] ^ 1]))
+    touch(infile)
+    assert not m.is_current(infile, outfile)
+
+
+def test_instruction_hash(inst, recorded):
+    m, infile, outfile = recorded
+    changed = copy.deepcopy(inst)
+    changed["instr"][0]["para"]["dT"] = 1e3
+    assert instruction_hash(changed) != instruction_hash(inst)
+    assert not manifest(m.file, changed).is_current(infile, outfile)
+
+    # Run settings do not change the outputs.
+    changed = copy.deepcopy(inst)
+    changed["para"].update(threads=4, step_size=10, telemetry=True)
+    changed["instr"][0]["para"]["module_threads"] = 2
+    changed["io"]["input"]["folder"] = "elsewhere"
+    assert instruction_hash(changed) == instruction_hash(inst)
+    assert manifest(m.file, changed).is_current(infile, outfile)
+
+
+def test_summary_interrupted(inst, tmp_path, monkeypatch):
+    summary = tmp_path / "out" / "summary.hdf5"
+    inst["io"]["output"] = str(summary)
+    inst["para"]["mode"] = "summarize"
+    process_manager(inst).run_processes()
+    with h5_reader(summary) as reader:
+        assert len(reader) == 100
+
+    # The input changes and the rebuild of the summary fails halfway.
+    write_root_input(tmp_path / "in" / "sim_1.root", 30, seed=2)
+    pm = process_manager(inst)
+    assert len(pm.args) == 1
+
+    def interrupted(self, writer, files, streamed):  # noqa: ARG001
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(process_manager, "_write_summary", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            pm.run_processes()
+    manifest_file = tmp_path / "out" / "summary.parts" / "postproc_manifest.json"
+    assert json.loads(manifest_file.read_text())["summary"] is None
+    # The previous summary is left intact, no temporary file remains.
+    assert sorted(p.name for p in summary.parent.iterdir()) == [
+        "summary.hdf5",
+        "summary.parts",
+    ]
+
+    # Nothing is reprocessed, but the summary is rebuilt.
+    pm = process_manager(inst)
+    assert not pm.args
+    pm.run_processes()
+    with h5_reader(summary) as reader:
+        assert len(reader) == 90
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import copy
+import os
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+import pytest
+import uproot
+from module_cache import module_cache
+from module_manager import module_manager
+from tqdm import tqdm
+
+
+@pytest.fixture
+def pipeline(inst, tmp_path):
+    # window -> sum -> thr, with the module outputs cached in tmp_path/cache.
+    inst["instr"].append(
+        {
+            "name": "thr",
+            "module": "threshold",
+            "input": ["Ew"],
+            "output": ["E_thr"],
+            "para": {"thr": [10, 200]},
+        }
+    )
+    inst["output"] = ["w_t", "Ew", "E_thr"]
+    inst["para"]["cache"] = {"dir": str(tmp_path / "cache")}
+    return inst
+
+
+def run(inst, monkeypatch=None):
+    """Outputs of the pipeline on sim_0 and the names of the modules run."""
+    mm = module_manager(inst)
+    executed = []
+    if monkeypatch is not None:
+        run_module = mm.telemetry.run_module
+
+        def counted(proc, processing_variables):
+            executed.append(proc.name)
+            run_module(proc, processing_variables)
+
+        monkeypatch.setattr(mm.telemetry, "run_module", counted)
+    infile = Path(inst["io"]["input"]["folder"]) / "sim_0.root"
+    with uproot.open(infile) as f:
+        batch = f["hit"].arrays(list(inst["input"]["var"]))
+    pv = {key: batch[key] for key in inst["input"]["var"]}
+    mm.run(pv, tqdm(disable=True), 0, (str(infile), 0, 60))
+    return {key: ak.to_list(pv[key]) for key in inst["output"]}, executed
+
+
+def test_cache_hits(pipeline, monkeypatch):
+    expected, executed = run(pipeline, monkeypatch)
+    assert executed == ["window", "sum", "thr"]
+    out, executed = run(pipeline, monkeypatch)
+    assert executed == []
+    assert out == expected
+
+
+def test_cache_downstream_change(pipeline, monkeypatch):
+    run(pipeline)
+    changed = copy.deepcopy(pipeline)
+    changed["instr"][2]["para"]["thr"] = [50, 200]
+    out, executed = run(changed, monkeypatch)
+    # Only the changed module runs, its input is loaded from the cache.
+    assert executed == ["thr"]
+    del changed["para"]["cache"]
+    assert out == run(changed)[0]
+
+
+def test_cache_upstream_change(pipeline, monkeypatch):
+    run(pipeline)
+    changed = copy.deepcopy(pipeline)
+    changed["instr"][0]["para"]["dT"] = 1e3
+    out, executed = run(changed, monkeypatch)
+    assert executed == ["window", "sum", "thr"]
+    # Execution parameters do not invalidate the cache.
+    changed["para"]["step_size"] = 7
+    assert run(changed, monkeypatch) == (out, [])
+
+
+def test_cache_eviction(tmp_path):
+    values = [ak.Array([[1.0, 2.0], [3.0]]), ak.Array(np.arange(100))]
+    cache = module_cache(tmp_path)
+    cache.put("a", values)
+    size = cache.path("a").stat().st_size
+    cache = module_cache(tmp_path, max_size=3.5 * size)
+    for i, key in enumerate("abc"):
+        cache.put(key, values)
+        os.utime(cache.path(key), (i + 1, i + 1))
+    # Reading an entry makes it the most recently used.
+    assert cache.get("a", ["x", "y"])["y"].to_list() == list(range(100))
+    cache.put("d", values)
+    assert [key in cache for key in "abcd"] == [True, False, True, True]
+    assert cache.disk_usage() == 3 * size
+
+
+def instructions(*modules, output=("c",)):
+    # Minimal instructions with input variables a and b.
+    return {
+        "input": {"var": {"a": "hit/a", "b": "hit/b"}},
+        "para": {},
+        "instr": [
+            {"name": name, "module": "sum_energy", "input": inputs, "output": outputs}
+            for name, inputs, outputs in modules
+        ],
+        "output": list(output),
+    }
+
+
+def test_build_graph_order():
+    mm = module_manager(
+        instructions(
+            ("third", ["y"], ["c"]),
+            ("first", ["a"], ["x"]),
+            ("second", ["x", "b"], ["y"]),
+            ("other", ["b"], ["z"]),
+        )
+    )
+    # Topological order, the instruction order where unconstrained.
+    assert [proc.name for proc in mm.order] == ["first", "second", "third", "other"]
+
+
+@pytest.mark.parametrize(
+    ("modules", "output", "message"),
+    [
+        ([("m1", ["a"], ["x"]), ("m2", ["b"], ["x"])], ["x"], "already produced by m1"),
+        ([("m1", ["a"], ["b"])], ["b"], "already produced by the input"),
+        ([("m1", ["a", "y"], ["x"])], ["x"], r"Inputs \['y'\] of module 'm1'"),
+        ([("m1", ["a"], ["x"])], ["x", "z"], r"Requested outputs \['z'\]"),
+        (
+            [("m1", ["a"], ["x"]), ("m2", ["x", "z"], ["y"]), ("m3", ["y"], ["z"])],
+            ["y"],
+            r"Modules \['m2', 'm3'\] are part of or depend on a cycle",
+        ),
+    ],
+)
+def test_build_graph_errors(modules, output, message):
+    with pytest.raises(ValueError, match=message):
+        module_manager(instructions(*modules, output=output))
+
+
+def test_module_threads(pipeline):
+    del pipeline["para"]["cache"]
+    # A second branch that can run next to sum and thr.
+    pipeline["instr"].append(
+        {
+            "name": "sum_hits",
+            "module": "sum_energy",
+            "input": ["t_sub"],
+            "output": ["T"],
+        }
+    )
+    pipeline["output"].append("T")
+    expected, _ = run(pipeline)
+    pipeline["para"]["module_threads"] = 4
+    assert run(pipeline)[0] == expected
@@ -0,0 +1,365 @@
+"""
+The compiled modules against the outputs of the original pure-Python
+implementations, on small hand-built inputs.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+import awkward as ak
+import numpy as np
+import pytest
+from modules import (
+    active_volume,
+    m_active_volume,
+    m_coincidence_window,
+    m_group_sensitive_volume,
+    m_r90_estimator,
+    m_window,
+)
+from modules.group_sensitive_volume import MAX_LOOKUP_TABLE_SIZE, group_lookup
+
+WINDOW_INPUT = ["t_all", "t", "edep", "vol", "x", "y", "z"]
+WINDOW_OUTPUT = ["w_t", "t_sub", "w_edep", "w_vol", "w_x", "w_y", "w_z"]
+GROUP_INPUT = ["t", "edep", "vol", "x", "y", "z"]
+GROUP_OUTPUT = ["g_t", "g_edep", "g_vol", "g_x", "g_y", "g_z"]
+
+
+def run(module, para, inputs, outputs, pv):
+    pv = dict(pv)
+    module(para, inputs, outputs, pv)
+    return {key: ak.to_list(pv[key]) for key in outputs}
+
+
+def hits(t, edep, t_all=None):
+    t = ak.Array(t)
+    return {
+        "t_all": t if t_all is None else ak.Array(t_all),
+        "t": t,
+        "edep": ak.Array(edep),
+        "vol": ak.values_astype(t * 0 + 1, np.int32),
+        "x": t * 2,
+        "y": t * 3,
+        "z": t * 4,
+    }
+
+
+def test_window():
+    pv = hits(
+        [[5.0, 100.0, 3.0, 300.0, 120.0], [7.0], [1.0, 2.0, 3.0]],
+        [[1.0, 2.0, 3.0, 4.0, 5.0], [6.0], [7.0, 8.0, 9.0]],
+    )
+    out = run(m_window, {"dT": 10.0}, WINDOW_INPUT, WINDOW_OUTPUT, pv)
+    # Hits at or after the last window start are not assigned to a window.
+    assert out["w_t"] == [[0.0, 97.0, 117.0, 297.0], [0.0], [0.0]]
+    assert out["t_sub"] == [[[2.0, 0.0], [97.0], [297.0]], [], []]
+    assert out["w_edep"] == [[[1.0, 3.0], [2.0], [4.0]], [], []]
+    assert out["w_vol"] == [[[1, 1], [1], [1]], [], []]
+    assert out["w_x"] == [[[10.0, 6.0], [200.0], [600.0]], [], []]
+    assert out["w_z"] == [[[20.0, 12.0], [400.0], [1200.0]], [], []]
+
+
+def test_window_empty_windows():
+    # t_all starts earlier than t, so the first window has no hit of t.
+    pv = hits(
+        [[50.0, 100.0, 55.0, 300.0], [20.0, 21.0]],
+        [[1.0, 2.0, 3.0, 4.0], [5.0, 6.0]],
+        t_all=[[0.0, 50.0], [0.0]],
+    )
+    out = run(m_window, {"dT": 10.0}, WINDOW_INPUT, WINDOW_OUTPUT, pv)
+    assert out["w_t"] == [[0.0, 50.0, 100.0, 300.0], [0.0, 20.0]]
+    assert out["t_sub"] == [[[0.0], [50.0, 55.0]], []]
+    assert out["w_edep"] == [[[0.0], [1.0, 3.0]], []]
+    assert out["w_vol"] == [[[0], [1, 1]], []]
+
+    out = run(
+        m_window,
+        {"dT": 10.0, "pad_empty_windows": False},
+        WINDOW_INPUT,
+        WINDOW_OUTPUT,
+        pv,
+    )
+    assert out["t_sub"] == [[[], [50.0, 55.0]], []]
+
+
+def test_window_empty_events():
+    pv = hits([[5.0, 100.0], [], [4.0]], [[1.0, 2.0], [], [3.0]])
+    out = run(m_window, {"dT": 10.0}, WINDOW_INPUT, WINDOW_OUTPUT, pv)
+    assert out["w_t"] == [[0.0, 95.0], [0.0], [0.0]]
+    assert out["t_sub"] == [[[0.0]], [], []]
+    assert out["w_edep"] == [[[1.0]], [], []]
+
+
+@pytest.fixture
+def windowed_hits():
+    t = ak.Array([[[1.0, 2.0, 3.0, 4.0], [5.0]], [], [[6.0], [7.0]], [[8.0]]])
+    vol = ak.Array([[[11, 10, 11, -1], [12]], [], [[10], [0]], [[-1]]])
+    return {
+        "t": t,
+        "edep": t * 10,
+        "vol": ak.values_astype(vol, np.int32),
+        "x": t,
+        "y": t,
+        "z": t,
+    }
+
+
+def test_group_sensitive_volume(windowed_hits):
+    out = run(m_group_sensitive_volume, {}, GROUP_INPUT, GROUP_OUTPUT, windowed_hits)
+    # Detectors in order of their first hit, negative volume IDs dropped.
+    assert out["g_t"] == [
+        [[[1.0, 3.0], [2.0]], [[5.0]]],
+        [],
+        [[[6.0]], [[7.0]]],
+        [[]],
+    ]
+    assert out["g_vol"] == [[[[11, 11], [10]], [[12]]], [], [[[10]], [[0]]], [[]]]
+    assert out["g_edep"] == [
+        [[[10.0, 30.0], [20.0]], [[50.0]]],
+        [],
+        [[[60.0]], [[70.0]]],
+        [[]],
+    ]
+
+
+@pytest.mark.parametrize(
+    ("sensitive_volumes", "lookup_table"),
+    [
+        ({"sensVolID": [10, 12, 5], "group": ["a", "a", "b"]}, True),
+        (
+            {"sensVolID": [10, 12, MAX_LOOKUP_TABLE_SIZE + 10], "group": ["a"] * 3},
+            False,
+        ),
+    ],
+)
+def test_group_sensitive_volume_group(windowed_hits, sensitive_volumes, lookup_table):
+    _, table, sv_in_group = group_lookup(
+        "a",
+        tuple(sensitive_volumes["sensVolID"]),
+        tuple(sensitive_volumes["group"]),
+    )
+    assert (table is not None) == lookup_table
+    assert (sv_in_group is not None) != lookup_table
+
+    para = {"group": "a", "sensitive_volumes": sensitive_volumes}
+    out = run(m_group_sensitive_volume, para, GROUP_INPUT, GROUP_OUTPUT, windowed_hits)
+    assert out["g_t"] == [[[2.0], [5.0]], [], [[6.0], []], [[]]]
+    assert out["g_vol"] == [[[10], [12]], [], [[10], []], [[]]]
+
+
+def test_group_sensitive_volume_unknown_group(windowed_hits):
+    para = {
+        "group": "c",
+        "sensitive_volumes": {"sensVolID": [10, 12], "group": ["a", "b"]},
+    }
+    out = run(m_group_sensitive_volume, para, GROUP_INPUT, GROUP_OUTPUT, windowed_hits)
+    assert out["g_t"] == [[[], []], [], [[], []], [[]]]
+
+
+def test_r90_estimator():
+    edep = ak.Array(
+        [[[[1.0, 2.0, 3.0], [0.0, 0.0]], [[]]], [], [[[5.0]]], [[[2.0, 2.0, 0.0, 1.0]]]]
+    )
+    x = ak.Array(
+        [[[[0.0, 1.0, 3.0], [1.0, 2.0]], [[]]], [], [[[2.0]]], [[[0.0, 4.0, 1.0, 2.0]]]]
+    )
+    pv = {"edep": edep, "x": x, "y": x * 0, "z": x * 0}
+    out = run(m_r90_estimator, {}, ["edep", "x", "y", "z"], ["r90"], pv)
+    # Detectors without hits or without deposited energy get 0, not NaN.
+    assert out["r90"] == [[[11 / 6, 0.0], [0.0]], [], [[0.0]], [[2.0]]]
+
+
+@pytest.fixture
+def window_starts():
+    w = ak.Array(
+        [
+            [0.0, 50.0, 120.0, 300.0, 1000.0],
+            [0.0, 10.0],
+            [0.0],
+            [0.0, 20.0, 40.0, 500.0],
+        ]
+    )
+    val = ak.Array(
+        [[1.0, 2.0, 4.0, 8.0, 16.0], [1.0, 2.0], [3.0], [1.0, 2.0, 3.0, 4.0]]
+    )
+    return {"w1": w, "w2": w, "val": val}
+
+
+@pytest.mark.parametrize(
+    ("t_min", "t_max", "expected"),
+    [
+        (0.0, 100.0, [[2.0, 4.0, 0.0], [], [], [2.0, 0.0]]),
+        (-60.0, 60.0, [[3.0, 3.0, 4.0], [], [], [3.0, 3.0]]),
+    ],
+)
+def test_coincidence_window(window_starts, t_min, t_max, expected):
+    # The last two windows of both lists are not considered.
+    para = {"t_min": t_min, "t_max": t_max}
+    out = run(m_coincidence_window, para, ["w1", "w2", "val"], ["c"], window_starts)
+    assert out["c"] == expected
+
+
+def test_coincidence_window_nested_values(window_starts):
+    window_starts["val"] = ak.Array(
+        [
+            [[1.0, 1.0], [2.0], [4.0], [8.0], [16.0]],
+            [[1.0], [2.0]],
+            [[3.0]],
+            [[1.0], [], [3.0], [4.0]],
+        ]
+    )
+    para = {"t_min": 0.0, "t_max": 100.0}
+    out = run(m_coincidence_window, para, ["w1", "w2", "val"], ["c"], window_starts)
+    assert out["c"] == [[2.0, 4.0, 0.0], [], [], [0.0, 0.0]]
+
+
+@pytest.mark.parametrize(
+    ("n_windows", "expected"), [(5, [2.0, 4.0, 0.0, 0.0]), (2, [0.0])]
+)
+def test_coincidence_window_flat(n_windows, expected):
+    # A flat list of windows is one event; only its last window is dropped
+    # from the first list.
+    w = ak.Array([0.0, 50.0, 120.0, 300.0, 1000.0][:n_windows])
+    pv = {"w1": w, "w2": w, "val": ak.Array([1.0, 2.0, 4.0, 8.0, 16.0][:n_windows])}
+    para = {"t_min": 0.0, "t_max": 100.0}
+    out = run(m_coincidence_window, para, ["w1", "w2", "val"], ["c"], pv)
+    assert out["c"] == expected
+
+
+@pytest.mark.parametrize(
+    ("inverse", "w_t", "edep"),
+    [
+        (False, [[0.0, 90.0], [], [5.0]], [[[2.0], [3.0]], [], [[4.0, 5.0]]]),
+        (True, [[0.0, 50.0], [], [0.0]], [[[501.0], [601.0]], [], [[701.0]]]),
+    ],
+)
+def test_active_volume_cylinder(inverse, w_t, edep):
+    x = ak.Array([[[1.0, 500.0], [600.0], [2.0]], [[]], [[700.0], [3.0, 4.0]]])
+    pv = {
+        "w_t": ak.Array([[0.0, 50.0, 90.0], [0.0], [0.0, 5.0]]),
+        "edep": x + 1,
+        "vol": x,
+        "x": x,
+        "y": x * 0,
+        "z": x * 0 + 5,
+    }
+    para = {
+        "type": "cylinder",
+        "conditions": {"r": 100, "h1": 10, "h2": 0},
+        "inverse": inverse,
+    }
+    inputs = ["w_t", "edep", "vol", "x", "y", "z"]
+    out = run(m_active_volume, para, inputs, ["c_t", "c_edep"], pv)
+    # Windows without a selected hit are removed from both outputs. (The
+    # original selected the leading windows instead for edep.)
+    assert out["c_t"] == w_t
+    assert out["c_edep"] == edep
+
+
+def test_active_volume_deadlayer(tmp_path, monkeypatch):
+    monkeypatch.delenv("POSTPROC_CACHE_DIR", raising=False)
+    geometry = {
+        "1010000": {
+            "center": [0.0, 0.0, 0.0],
+            "surface_mesh": {
+                "orig": {"r": [31.0, 40.0, 26.0], "z": [0.0, 20.0, 80.0]},
+                "dl": {"r": [30.0, 39.0, 25.0], "z": [0.0, 20.0, 80.0]},
+            },
+        },
+        # A mesh with unsorted z uses the linear segment scan.
+        "1010001": {
+            "center": [100.0, 0.0, 0.0],
+            "surface_mesh": {
+                "orig": {"r": [11.0, 11.0, 21.0, 21.0], "z": [0.0, 50.0, 50.0, 0.0]},
+                "dl": {"r": [10.0, 10.0, 20.0, 20.0], "z": [0.0, 50.0, 40.0, 0.0]},
+            },
+        },
+    }
+    geometry_file = tmp_path / "geometry.json"
+    geometry_file.write_text(json.dumps(geometry))
+
+    vol = ak.Array(
+        [
+            [[[1010000, 1010000], [1010001]], [[1010001]]],
+            [],
+            [[[1010000]]],
+            [[[1010001, 1010001, 1010001]]],
+        ]
+    )
+    x = ak.Array(
+        [[[[0.0, 35.0], [105.0]], [[150.0]]], [], [[[29.0]]], [[[100.0, 115.0, 100.0]]]]
+    )
+    z = ak.Array(
+        [[[[10.0, 10.0], [30.0]], [[30.0]]], [], [[[1.0]]], [[[45.0, 42.0, 60.0]]]]
+    )
+    pv = {
+        "t": x * 0 + 1.0,
+        "edep": x + 1,
+        "vol": ak.values_astype(vol, np.int32),
+        "x": x,
+        "y": x * 0,
+        "z": z,
+    }
+    para = {"type": "deadlayer", "file": str(geometry_file)}
+    outputs = ["a_t", "a_edep", "a_vol", "a_x", "a_y", "a_z", "a_vol_red"]
+    out = run(m_active_volume, para, GROUP_INPUT, outputs, pv)
+    assert out["a_edep"] == [[[[1.0], [106.0]], [[]]], [], [[[30.0]]], [[[101.0]]]]
+    assert out["a_vol"] == [
+        [[[1010000], [1010001]], [[]]],
+        [],
+        [[[1010000]]],
+        [[[1010001]]],
+    ]
+    assert out["a_z"] == [[[[10.0], [30.0]], [[]]], [], [[[1.0]]], [[[45.0]]]]
+    assert out["a_vol_red"] == [
+        [[1010000, 1010001], [1010001]],
+        [],
+        [[1010000]],
+        [[1010001]],
+    ]
+
+
+def test_deadlayer_geometry_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("POSTPROC_CACHE_DIR", raising=False)
+    monkeypatch.setattr(active_volume, "_geometry_cache", {})
+    geometry = {
+        "1010000": {
+            "center": [0.0, 0.0, 0.0],
+            "surface_mesh": {"dl": {"r": [30.0, 25.0], "z": [0.0, 80.0]}},
+        }
+    }
+    geometry_file = tmp_path / "geometry.json"
+    geometry_file.write_text(json.dumps(geometry))
+    parsed = []
+    parse = active_volume.parse_deadlayer_geometry
+    monkeypatch.setattr(
+        active_volume,
+        "parse_deadlayer_geometry",
+        lambda dl_input: parsed.append(1) or parse(dl_input),
+    )
+
+    def load(cache=None):
+        active_volume._geometry_cache.clear()
+        return active_volume.load_deadlayer_geometry(geometry_file, cache)
+
+    # The disk cache is opt-in.
+    assert active_volume.geometry_cache_dir() is None
+    load()
+    cache = tmp_path / "cache"
+    load(str(cache))
+    assert len(parsed) == 2
+    assert len(list(cache.glob("*.npz"))) == 1
+    # Unchanged, or only touched: the parsed geometry is reused.
+    assert load(str(cache))["r_dl"].tolist() == [30.0, 25.0]
+    stat = geometry_file.stat()
+    os.utime(geometry_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    load(str(cache))
+    monkeypatch.setenv("POSTPROC_CACHE_DIR", str(cache))
+    load()
+    assert len(parsed) == 2
+    geometry["1010000"]["surface_mesh"]["dl"]["r"] = [31.0, 25.0]
+    geometry_file.write_text(json.dumps(geometry))
+    assert load()["r_dl"].tolist() == [31.0, 25.0]
+    assert len(parsed) == 3
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import copy
+
+import awkward as ak
+import pytest
+from h5_reader import output_reader
+from output import output_options, output_suffix, output_writer
+from process_manager import process_manager
+
+pytest.importorskip("pyarrow")
+
+from parquet_writer import parquet_writer
+
+
+def test_output_options():
+    inst = {"io": {"output": "out"}}
+    assert output_options(inst) == ("out", "hdf5")
+    assert output_suffix(inst) == ".hdf5"
+    inst = {"io": {"output": {"path": "out", "format": "parquet"}}}
+    assert output_options(inst) == ("out", "parquet")
+    assert output_suffix(inst) == ".parquet"
+    inst["io"]["storage"] = {"compression": "zstd", "chunk_events": 10}
+    writer = output_writer(inst)
+    assert writer.func is parquet_writer
+    assert writer.keywords == {"compression": "zstd", "chunk_events": 10}
+    inst["io"]["output"]["format"] = "csv"
+    with pytest.raises(ValueError, match="Unsupported output format"):
+        output_options(inst)
+
+
+def test_write_unknown_first_batch(tmp_path):
+    batches = [
+        ak.Array({"x": [[], []], "y": [1.0, 2.0]}),
+        ak.Array({"x": [[1.0], [2.0, 3.0]], "y": [3.0, 4.0]}),
+        ak.Array({"x": [[]], "y": [5.0]}),
+    ]
+    with parquet_writer(tmp_path / "out.parquet", chunk_events=2) as writer:
+        for batch in batches:
+            writer.write(batch)
+    array = ak.from_parquet(tmp_path / "out.parquet")
+    assert array.to_list() == ak.concatenate(batches).to_list()
+    assert str(array.type) == "5 * {x: var * float64, y: float64}"
+
+
+def test_write_unknown_only(tmp_path):
+    with parquet_writer(tmp_path / "out.parquet") as writer:
+        writer.write(ak.Array({"x": [[], []]}))
+    assert ak.from_parquet(tmp_path / "out.parquet").to_list() == [{"x": []}] * 2
+
+
+def run(inst, output_format, path):
+    inst = copy.deepcopy(inst)
+    inst["io"]["output"] = {"path": str(path), "format": output_format}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if inst["para"].get("mode") != "summarize":
+        path.mkdir()
+    process_manager(inst).run_processes()
+
+
+def read_hdf5(path):
+    with output_reader(path) as reader:
+        return ak.to_packed(reader.array()).to_list()
+
+
+@pytest.mark.parametrize("entries_per_task", [None, 15])
+def test_parquet_outputs(inst, tmp_path, entries_per_task):
+    inst["para"]["entries_per_task"] = entries_per_task
+    run(inst, "hdf5", tmp_path / "hdf5")
+    run(inst, "parquet", tmp_path / "parquet")
+    for name in ("sim_0", "sim_1"):
+        expected = read_hdf5(tmp_path / "hdf5" / f"{name}.hdf5")
+        array = ak.from_parquet(tmp_path / "parquet" / f"{name}.parquet")
+        assert array.to_list() == expected
+    # Split inputs are merged in entry order, without leftover partial files.
+    assert sorted(p.name for p in (tmp_path / "parquet").iterdir()) == [
+        "postproc_manifest.json",
+        "sim_0.parquet",
+        "sim_1.parquet",
+    ]
+
+
+def test_parquet_summary(inst, tmp_path):
+    inst["para"]["mode"] = "summarize"
+    run(inst, "hdf5", tmp_path / "hdf5" / "summary.hdf5")
+    run(inst, "parquet", tmp_path / "parquet" / "summary.parquet")
+    array = ak.from_parquet(tmp_path / "parquet" / "summary.parquet")
+    assert len(array) == 100
+    assert array.to_list() == read_hdf5(tmp_path / "hdf5" / "summary.hdf5")
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import copy
+from pathlib import Path
+
+from h5_reader import h5_reader
+from process_manager import process_manager
+
+
+def read(file):
+    with h5_reader(file) as reader:
+        return reader.read().to_list()
+
+
+def outputs(inst):
+    return sorted(p.name for p in Path(inst["io"]["output"]).iterdir())
+
+
+def test_entry_ranges(inst):
+    pm = process_manager(inst)
+    infile = Path(inst["io"]["input"]["folder"]) / "sim_0.root"
+    assert pm.entry_ranges(infile) == [(None, None)]
+    inst["para"]["entries_per_task"] = 25
+    pm = process_manager(inst)
+    assert pm.entry_ranges(infile) == [(0, 25), (25, 50), (50, 60)]
+    # Every range is a job of its own, writing a partial output.
+    jobs = sorted(job for task in pm.args for job in task[0])
+    assert [job[2:] for job in jobs] == [
+        (0, 25),
+        (25, 50),
+        (50, 60),
+        (0, 25),
+        (25, 40),
+    ]
+    assert Path(jobs[0][1]).name == "sim_0.part0000.hdf5"
+
+
+def test_split_outputs(inst, tmp_path):
+    unsplit = copy.deepcopy(inst)
+    unsplit["io"]["output"] = str(tmp_path / "unsplit")
+    Path(unsplit["io"]["output"]).mkdir()
+    process_manager(unsplit).run_processes()
+
+    inst["para"]["entries_per_task"] = 15
+    process_manager(inst).run_processes()
+    # The partial outputs are merged in entry order and removed.
+    assert outputs(inst) == outputs(unsplit)
+    for name in ("sim_0.hdf5", "sim_1.hdf5"):
+        assert read(tmp_path / "out" / name) == read(tmp_path / "unsplit" / name)
+
+
+def test_split_missing_part(inst, tmp_path):
+    process_manager(inst).run_processes()
+    # The input changes, and one of its entry ranges fails.
+    (tmp_path / "in" / "sim_0.root").touch()
+    inst["para"]["entries_per_task"] = 25
+    pm = process_manager(inst)
+    merge = pm.merge_partial_files
+
+    def merge_with_missing_part():
+        (tmp_path / "out" / "sim_0.part0001.hdf5").unlink()
+        merge()
+
+    pm.merge_partial_files = merge_with_missing_part
+    pm.run_processes()
+    # Neither the incomplete merge nor the previous output is kept, and the
+    # input is processed again on the next run.
+    assert outputs(inst) == ["postproc_manifest.json", "sim_1.hdf5"]
+    pm = process_manager(inst)
+    assert {job[0].name for task in pm.args for job in task[0]} == {"sim_0.root"}
+
+
+def schedule(costs, min_task_size=None, threads=1):
+    # Tasks of jobs with the given costs, each job named by its cost.
+    pm = object.__new__(process_manager)
+    pm.threads = threads
+    jobs = [(f"{cost}", f"{cost}.hdf5", None, None, cost) for cost in costs]
+    return [
+        [float(job[0]) for job in task] for task in pm.schedule(jobs, min_task_size)
+    ]
+
+
+def test_schedule_order():
+    # Jobs of at least min_task_size are tasks of their own, largest first.
+    assert schedule([3, 10, 5, 7], min_task_size=3) == [[10], [7], [5], [3]]
+
+
+def test_schedule_packing():
+    # Small jobs are packed until their task reaches min_task_size, the
+    # remainder forms the last task.
+    tasks = schedule([20, 1, 4, 2, 3, 1, 2, 0.5], min_task_size=5)
+    assert tasks == [[20], [4, 3], [2, 2, 1], [1, 0.5]]
+
+
+def test_schedule_default_size():
+    # A quarter of the work per worker: 40 / (4 * 2) = 5.
+    tasks = schedule([5, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3], threads=2)
+    assert tasks == [[4, 4], [3, 3], [3, 3], [3, 3], [3, 3], [5], [3]]